@@ -38,16 +38,22 @@ import codecs
 import sys
 import logging
 import warnings
+import threading
 import util
 from preprocessors import build_preprocessors
 from blockprocessors import build_block_parser
-from treeprocessors import build_treeprocessors
+from treeprocessors import build_treeprocessors, PrettifyTreeprocessor
 from inlinepatterns import build_inlinepatterns
 from postprocessors import build_postprocessors
 from extensions import Extension
-from serializers import to_html_string, to_xhtml_string
+from serializers import to_html_string, to_xhtml_string, to_text_string, \
+    MINIFIED
+import streaming
+import excerpt
+import cache
+from metadata import extract_metadata
 
-__all__ = ['Markdown', 'markdown', 'markdownFromFile']
+__all__ = ['Markdown', 'markdown', 'markdownFromFile', 'extract_metadata']
 
 logger = logging.getLogger('MARKDOWN')
 
@@ -57,12 +63,19 @@ class Markdown:
 
     doc_tag = "div"     # Element used to wrap document - later removed
 
+    # Attributes which belong to a conversion and are kept in its
+    # RenderContext. Extensions add the names of those they set.
+    context_attributes = ('lines', 'references', 'htmlStash',
+                          'raw_html_found')
+
     option_defaults = {
         'html_replacement_text' : '[HTML_REMOVED]',
         'tab_length'            : 4,
         'enable_attributes'     : True,
         'smart_emphasis'        : True,
         'lazy_ol'               : True,
+        'collect_stats'         : False,
+        'minify'                : False,
     }
 
     output_formats = {
@@ -99,14 +112,33 @@ class Markdown:
             and "html4") be used as "xhtml" or "html" may change in the future
             if it makes sense at that time.
         * safe_mode: Disallow raw html. One of "remove", "replace" or "escape".
+           After `convert`, `raw_html_found` tells whether the source had raw
+           html blocks, tags or entities. In "escape" mode tags are escaped
+           as text and not counted.
         * html_replacement_text: Text used when safe_mode is set to "replace".
         * tab_length: Length of tabs in the source. Default: 4
         * enable_attributes: Enable the conversion of attributes. Default: True
         * smart_emphasis: Treat `_connected_words_` intelegently Default: True
         * lazy_ol: Ignore number of first item of ordered lists. Default: True
+        * collect_stats: Record the time spent in each processor and pattern
+           in `self.stats`. The records are kept for the instance, so only
+           collect them with one thread converting. Default: False
+        * minify: Serialize the html without the whitespace between blocks
+           and, for html output formats, without the end tags html5 makes
+           optional and the quotes of attribute values which need none.
+           Default: False
+        * cache_dir: Directory in which `convertFile` keeps the html of the
+           files it converts, to reuse it while they do not change. See the
+           `cache` module. Default: None
+        * cache_size: Bound of the size of `cache_dir` in bytes.
+
+        An instance can be shared by threads. Each conversion keeps its state
+        in a RenderContext of its own (see `context`).
 
         """
 
+        self._local = threading.local()
+
         # For backward compatibility, loop through old positional args
         pos = ['extensions', 'extension_configs', 'safe_mode', 'output_format']
         c = 0
@@ -131,13 +163,22 @@ class Markdown:
         self.docType = ""
         self.stripTopLevelTags = True
 
+        self.stats = None
+        if self.collect_stats:
+            self.stats = util.Stats()
+
         self.build_parser()
 
-        self.references = {}
-        self.htmlStash = util.HtmlStash()
         self.registerExtensions(extensions=kwargs.get('extensions', []),
                                 configs=kwargs.get('extension_configs', {}))
         self.set_output_format(kwargs.get('output_format', 'xhtml1'))
+
+        self.cache = None
+        if kwargs.get('cache_dir'):
+            self.cache = cache.Cache(kwargs['cache_dir'],
+                kwargs.get('cache_size') or cache.DEFAULT_MAX_SIZE,
+                cache.fingerprint(kwargs.get('extensions', []),
+                                  kwargs.get('extension_configs', {})))
         self.reset()
 
     def build_parser(self):
@@ -223,41 +264,84 @@ class Markdown:
         self.registeredExtensions.append(extension)
         return self
 
-    def reset(self):
-        """
-        Resets all state variables so that we can start with a new text.
-        """
-        self.htmlStash.reset()
-        self.references.clear()
+    def __getattr__(self, name):
+        # Only called for attributes the instance does not have
+        if name in self.context_attributes:
+            return getattr(self.context, name)
+        raise AttributeError(name)
 
+    def __setattr__(self, name, value):
+        if name in self.context_attributes:
+            setattr(self.context, name, value)
+        else:
+            self.__dict__[name] = value
+
+    def _get_context(self):
+        try:
+            return self._local.context
+        except AttributeError:
+            # The first conversion in this thread
+            self._reset_context()
+            return self._local.context
+
+    # The RenderContext of the current conversion in this thread
+    context = property(_get_context)
+
+    def _reset_context(self):
+        """ Start a new RenderContext in this thread. """
+        self._local.context = util.RenderContext()
         for extension in self.registeredExtensions:
             if hasattr(extension, 'reset'):
                 extension.reset()
 
+    def reset(self):
+        """
+        Resets all state variables so that we can start with a new text.
+
+        `convert` starts with a new RenderContext anyway. This also forgets
+        the stats.
+        """
+        self._reset_context()
+        if self.stats is not None:
+            self.stats.reset()
         return self
 
     def set_output_format(self, format):
         """ Set the output format for the class instance. """
         self.output_format = format.lower()
+        self.serializer = self._get_serializer(self.output_format)
+        return self
+
+    def _get_serializer(self, format):
+        """ Return the serializer of an output format. """
         try:
-            self.serializer = self.output_formats[self.output_format]
+            serializer = self.output_formats[format.lower()]
         except KeyError, e:
             valid_formats = self.output_formats.keys()
             valid_formats.sort()
             message = 'Invalid Output Format: "%s". Use one of %s.' \
-                       % (self.output_format, 
+                       % (format.lower(),
                           '"' + '", "'.join(valid_formats) + '"')
             e.args = (message,) + e.args[1:]
             raise
-        return self
+        if self.minify:
+            serializer = MINIFIED.get(serializer, serializer)
+        return serializer
 
-    def convert(self, source):
+    def convert(self, source, max_blocks=None, max_chars=None):
         """
         Convert markdown to serialized XHTML or HTML.
 
         Keyword arguments:
 
         * source: Source text as a Unicode string.
+        * max_blocks: Convert only the first `max_blocks` top-level blocks.
+        * max_chars: Convert only the top-level blocks up to the one which
+          brings the text to `max_chars` characters.
+
+        With `max_blocks` or `max_chars`, only an excerpt of the document
+        is converted, at a cost which does not grow with its length. See
+        the `excerpt` module.
 
         Markdown processing takes place in five steps:
 
@@ -273,17 +357,151 @@ class Markdown:
 
         """
 
+        self._reset_context()
+
         # Fixup the source text
         if not source.strip():
             return u""  # a blank unicode string
 
+        source = self._unicode(source)
+        if max_blocks is None and max_chars is None:
+            root = self._parse(source)
+        else:
+            root = excerpt.parse(self, source, max_blocks, max_chars)
+
+        # Run the tree-processors. A minified serializer writes no whitespace
+        # between blocks, so the stock prettify treeprocessor is skipped.
+        treeprocessors = self.treeprocessors.items()
+        if self.serializer in MINIFIED.values() and self._prettify_last():
+            treeprocessors = treeprocessors[:-1]
+        for name, treeprocessor in treeprocessors:
+            newRoot = self._run_stage('treeprocessor', name, treeprocessor.run,
+                                      root)
+            if newRoot:
+                root = newRoot
+
+        # Serialize _properly_.  Strip top-level tags.
+        output = self._run_stage('serializer', self.output_format,
+                                 self._serialize, root)
+
+        self.raw_html_found = self.htmlStash.raw_html_found
+
+        # Run the text post-processors
+        for name, pp in self.postprocessors.items():
+            output = self._run_stage('postprocessor', name, pp.run, output)
+
+        return output.strip()
+
+    def convertBlocks(self, source):
+        """
+        Convert markdown to a list of the serialized HTML of each top-level
+        block, such as a paragraph, a list or the footnotes.
+
+        The processors run as for `convert`, except that the serializer and
+        the postprocessors run on each block in turn. Joined with newlines,
+        the blocks make up the HTML `convert` returns for `source`, but for
+        the whitespace between them.
+
+        """
+        self._reset_context()
+        if not source.strip():
+            return []
+
+        root = self._process(self._unicode(source))
+        blocks = []
+        for element in root:
+            # The whitespace after a block is not part of it.
+            element.tail = None
+            output = self._run_stage('serializer', self.output_format,
+                                     self.serializer, element)
+            for name, pp in self.postprocessors.items():
+                output = self._run_stage('postprocessor', name, pp.run,
+                                         output)
+            blocks.append(output.strip())
+        return blocks
+
+    def convertFormats(self, source, formats=('html5', 'text')):
+        """
+        Convert markdown to several outputs at once and return a dict of
+        them, keyed by format.
+
+        Keyword arguments:
+
+        * source: Source text as a Unicode string.
+        * formats: The formats to return. Each is one of the output formats
+          (see `set_output_format`), "text" or "toc".
+
+        The source is parsed and the treeprocessors run only once. The tree
+        is then serialized in each output format and postprocessed. "text"
+        is the text of the tree without markup, for indexing and snippets:
+        the postprocessors restore it with their `run_text` method, and raw
+        html is left out but for its text, and so is the table of contents
+        the toc extension puts in the document. "toc" is that table of
+        contents, or None without the toc extension.
+
+        Extensions which look at the output format see the format of the
+        instance while the tree is made. Postprocessors see the format they
+        postprocess in `context.output_format`, so that the footnotes can
+        leave out the attributes which are invalid in HTML5.
+
+        """
+        for format in formats:
+            if format not in ('text', 'toc'):
+                self._get_serializer(format)
+        self._reset_context()
+        results = dict.fromkeys(formats, u"")
+        if not source.strip():
+            if 'toc' in results:
+                results['toc'] = None
+            return results
+
+        root = self._process(self._unicode(source))
+        for format in formats:
+            self.context.output_format = format
+            if format == 'toc':
+                results[format] = getattr(self.context, 'toc', None)
+                continue
+            if format == 'text':
+                output = self._run_stage('serializer', format,
+                                         to_text_string, root,
+                                         self.context.text_excluded)
+            else:
+                output = self._run_stage('serializer', format,
+                                         self._serialize, root,
+                                         self._get_serializer(format))
+            for name, pp in self.postprocessors.items():
+                if format == 'text':
+                    output = self._run_stage('postprocessor', name,
+                                             pp.run_text, output)
+                else:
+                    output = self._run_stage('postprocessor', name, pp.run,
+                                             output)
+            results[format] = output.strip()
+        self.context.output_format = None
+        return results
+
+    def _unicode(self, source):
+        """ Return the source text as unicode. """
         try:
-            source = unicode(source)
+            return unicode(source)
         except UnicodeDecodeError, e:
             # Customise error message while maintaining original trackback
             e.reason += '. -- Note: Markdown only accepts unicode input!'
             raise
 
+    def _process(self, source):
+        """ Parse the source text, run the treeprocessors and return the root. """
+        root = self._parse(source)
+        for name, treeprocessor in self.treeprocessors.items():
+            newRoot = self._run_stage('treeprocessor', name, treeprocessor.run,
+                                      root)
+            if newRoot:
+                root = newRoot
+        self.raw_html_found = self.htmlStash.raw_html_found
+        return root
+
+    def _parse(self, source, max_blocks=None, max_chars=None):
+        """ Preprocess and parse the source text and return the root. """
         source = source.replace(util.STX, "").replace(util.ETX, "")
         source = source.replace("\r\n", "\n").replace("\r", "\n") + "\n\n"
         source = re.sub(r'\n\s+\n', '\n\n', source)
@@ -291,20 +509,28 @@ class Markdown:
 
         # Split into lines and run the line preprocessors.
         self.lines = source.split("\n")
-        for prep in self.preprocessors.values():
-            self.lines = prep.run(self.lines)
+        for name, prep in self.preprocessors.items():
+            self.lines = self._run_stage('preprocessor', name, prep.run,
+                                         self.lines)
 
         # Parse the high-level elements.
-        root = self.parser.parseDocument(self.lines).getroot()
-
-        # Run the tree-processors
-        for treeprocessor in self.treeprocessors.values():
-            newRoot = treeprocessor.run(root)
-            if newRoot:
-                root = newRoot
-
-        # Serialize _properly_.  Strip top-level tags.
-        output = self.serializer(root)
+        return self.parser.parseDocument(self.lines, max_blocks,
+                                         max_chars).getroot()
+
+    def _run_stage(self, stage, name, func, *args):
+        """ Call a stage of the conversion, timing it if stats are kept. """
+        if self.stats is None:
+            return func(*args)
+        return self.stats.time(stage, name, func, *args)
+
+    def _prettify_last(self):
+        """ Whether the last treeprocessor is the stock prettify one. """
+        return self.treeprocessors.keyOrder[-1:] == ['prettify'] and \
+            self.treeprocessors['prettify'].__class__ is PrettifyTreeprocessor
+
+    def _serialize(self, root, serializer=None):
+        """ Serialize the tree and strip the top-level tags. """
+        output = (serializer or self.serializer)(root)
         if self.stripTopLevelTags:
             try:
                 start = output.index('<%s>'%self.doc_tag)+len(self.doc_tag)+2
@@ -317,14 +543,10 @@ class Markdown:
                 else:
                     # We have a serious problem
                     raise ValueError('Markdown failed to strip top-level tags. Document=%r' % output.strip())
+        return output
 
-        # Run the text post-processors
-        for pp in self.postprocessors.values():
-            output = pp.run(output)
-
-        return output.strip()
-
-    def convertFile(self, input=None, output=None, encoding=None):
+    def convertFile(self, input=None, output=None, encoding=None,
+                    stream=False):
         """Converts a markdown file and returns the HTML as a unicode string.
 
         Decodes the file using the provided encoding (defaults to utf-8),
@@ -342,9 +564,19 @@ class Markdown:
         * input: File object or path. Reads from stdin if `None`.
         * output: File object or path. Writes to stdout if `None`.
         * encoding: Encoding of input and output files. Defaults to utf-8.
+        * stream: Convert the file chunk by chunk from a memory map of it
+          and write the html of each chunk as it is made, so that large
+          files take little memory. See `markdown.streaming`. The cache is
+          not used then.
+
+        If the instance has a `cache_dir`, the html is taken from the cache
+        when it holds the conversion of the same text.
 
         """
 
+        if stream:
+            return streaming.convert_file(self, input, output, encoding)
+
         encoding = encoding or "utf-8"
 
         # Read the source
@@ -360,10 +592,13 @@ class Markdown:
             if not isinstance(text, unicode):
                 text = text.decode(encoding)
 
-        text = text.lstrip('\ufeff') # remove the byte-order mark
+        text = text.lstrip(u'\ufeff') # remove the byte-order mark
 
         # Convert
-        html = self.convert(text)
+        if self.cache is not None:
+            html = self.cache.convert(self, text)
+        else:
+            html = self.convert(text)
 
         # Write to file or stdout
         if output:
@@ -430,6 +665,7 @@ def markdownFromFile(*args, **kwargs):
     * input: a file name or readable object.
     * output: a file name or writable object.
     * encoding: Encoding of input and output.
+    * stream: Convert the file chunk by chunk. See `Markdown.convertFile`.
     * Any arguments accepted by the Markdown class.
 
     """
@@ -446,5 +682,6 @@ def markdownFromFile(*args, **kwargs):
     md = Markdown(**kwargs)
     md.convertFile(kwargs.get('input', None),
                    kwargs.get('output', None),
-                   kwargs.get('encoding', None))
+                   kwargs.get('encoding', None),
+                   kwargs.get('stream', False))
 
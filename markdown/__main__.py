@@ -5,6 +5,7 @@ COMMAND-LINE SPECIFIC STUFF
 """
 
 import markdown
+from markdown import batch, parallel
 import sys
 import optparse
 
@@ -18,7 +19,9 @@ def parse_options():
     Define and parse `optparse` options for command-line usage.
     """
     usage = """%prog [options] [INPUTFILE]
-       (STDIN is assumed if no INPUTFILE is given)"""
+       (STDIN is assumed if no INPUTFILE is given)
+       %prog [options] -d OUTPUT_DIR INPUT [INPUT ...]
+       (batch mode: each INPUT is a directory, glob pattern or file)"""
     desc = "A Python implementation of John Gruber's Markdown. " \
            "http://packages.python.org/Markdown/"
     ver = "%%prog %s" % markdown.version
@@ -49,6 +52,36 @@ def parse_options():
     parser.add_option("-n", "--no_lazy_ol", dest="lazy_ol", 
                       action='store_false', default=True,
                       help="Observe number of first item of ordered lists.")
+    parser.add_option("-m", "--minify", dest="minify", action="store_true",
+                      default=False,
+                      help="Leave out of the output the whitespace, end tags "
+                           "and quotes which are not needed.")
+    parser.add_option("-d", "--output_dir", dest="output_dir", default=None,
+                      metavar="OUTPUT_DIR",
+                      help="Batch mode: convert all inputs into OUTPUT_DIR, "
+                           "mirroring the input tree.")
+    parser.add_option("-j", "--jobs", dest="jobs", type="int", default=None,
+                      help="Number of processes used in batch and parallel "
+                           "mode. Defaults to the number of CPUs.")
+    parser.add_option("-w", "--watch", dest="watch", action="store_true",
+                      default=False,
+                      help="Batch mode: keep converting inputs as they "
+                           "change, rebuilding only changed files.")
+    parser.add_option("--stream", dest="stream", action="store_true",
+                      default=False,
+                      help="Convert INPUTFILE chunk by chunk to keep memory "
+                           "use low on large files.")
+    parser.add_option("-p", "--parallel", dest="parallel",
+                      action="store_true", default=False,
+                      help="Convert INPUTFILE in chunks spread over JOBS "
+                           "processes, for very large documents.")
+    parser.add_option("--cache_dir", dest="cache_dir", default=None,
+                      metavar="CACHE_DIR",
+                      help="Keep converted files in CACHE_DIR and reuse "
+                           "them while the source and options are unchanged.")
+    parser.add_option("--cache_size", dest="cache_size", type="int",
+                      default=None, metavar="MEGABYTES",
+                      help="Bound of the size of CACHE_DIR in megabytes.")
 
     (options, args) = parser.parse_args()
 
@@ -60,13 +93,39 @@ def parse_options():
     if not options.extensions:
         options.extensions = []
 
-    return {'input': input_file,
-            'output': options.filename,
-            'safe_mode': options.safe,
-            'extensions': options.extensions,
-            'encoding': options.encoding,
-            'output_format': options.output_format,
-            'lazy_ol': options.lazy_ol}, options.verbose
+    md_options = {'safe_mode': options.safe,
+                  'extensions': options.extensions,
+                  'encoding': options.encoding,
+                  'output_format': options.output_format,
+                  'lazy_ol': options.lazy_ol,
+                  'minify': options.minify,
+                  'cache_dir': options.cache_dir,
+                  'cache_size': options.cache_size and
+                                options.cache_size * 1024 * 1024}
+
+    if options.watch and not options.output_dir:
+        parser.error("--watch needs an OUTPUT_DIR")
+    if options.stream and options.output_dir:
+        parser.error("--stream cannot be used in batch mode")
+    if options.parallel and (options.output_dir or options.stream):
+        parser.error("--parallel cannot be used in batch or stream mode")
+    if options.output_dir:
+        if not args:
+            parser.error("batch mode needs at least one INPUT")
+        md_options.update({'inputs': args,
+                           'output_dir': options.output_dir,
+                           'jobs': options.jobs,
+                           'watch': options.watch})
+    elif options.parallel:
+        md_options.update({'input': input_file,
+                           'output': options.filename,
+                           'jobs': options.jobs,
+                           'parallel': True})
+    else:
+        md_options.update({'input': input_file,
+                           'output': options.filename,
+                           'stream': options.stream})
+    return md_options, options.verbose
 
 def run():
     """Run Markdown from the command line."""
@@ -78,7 +137,22 @@ def run():
     logger.addHandler(logging.StreamHandler())
 
     # Run
-    markdown.markdownFromFile(**options)
+    if options.pop('watch', False):
+        def report(stats):
+            sys.stderr.write(batch.format_stats(stats) + '\n')
+        try:
+            batch.watch(report=report, **options)
+        except KeyboardInterrupt:
+            pass
+    elif options.pop('parallel', False):
+        parallel.convert_file(**options)
+    elif 'output_dir' in options:
+        stats = batch.convert_tree(**options)
+        sys.stderr.write(batch.format_stats(stats) + '\n')
+        if stats['errors']:
+            sys.exit(1)
+    else:
+        markdown.markdownFromFile(**options)
 
 if __name__ == '__main__':
     # Support running module as a commandline command. 
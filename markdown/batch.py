@@ -0,0 +1,401 @@
+"""
+BATCH CONVERSION
+=============================================================================
+
+Convert whole trees of Markdown files at once. The files are spread over a
+pool of worker processes. Each worker builds one Markdown instance when it
+starts and reuses it for every file it is given, so the cost of importing
+markdown and loading extensions is paid once per worker rather than once
+per file. The layout of the input tree is mirrored in the output directory.
+
+    from markdown import batch
+    stats = batch.convert_tree(['docs/'], 'site/', extensions=['extra'])
+
+An incremental build keeps a manifest in the output directory and only
+converts files whose content or options changed since the last build.
+`watch` repeats incremental builds whenever the inputs change.
+
+"""
+
+import os
+import glob
+import time
+import hashlib
+import logging
+import markdown
+from markdown import cache
+try:
+    import json
+except ImportError:
+    import simplejson as json
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+logger = logging.getLogger('MARKDOWN')
+
+# Files in a directory are converted when they end with one of these.
+SOURCE_SUFFIXES = ('.md', '.markdown', '.mdown', '.mkd', '.txt')
+# Suffix given to the output files.
+OUTPUT_SUFFIX = '.html'
+# Name of the manifest file of incremental builds in the output directory.
+MANIFEST_NAME = '.markdown-manifest.json'
+
+# The Markdown instance of a worker process
+_md = None
+
+
+def find_sources(inputs, suffixes=SOURCE_SUFFIXES):
+    """
+    Return a sorted list of (path, relative path) tuples for `inputs`.
+
+    Each input may be a directory (searched recursively for files ending
+    with one of `suffixes`), a glob pattern or a single file. The relative
+    path is relative to the directory or to the fixed part of the pattern
+    and is used to place the output file.
+
+    """
+    sources = {}
+    for item in inputs:
+        if os.path.isdir(item):
+            for dirpath, dirnames, filenames in os.walk(item):
+                dirnames.sort()
+                for name in filenames:
+                    if name.lower().endswith(suffixes):
+                        path = os.path.join(dirpath, name)
+                        sources[path] = os.path.relpath(path, item)
+        else:
+            base = _glob_base(item)
+            for path in glob.glob(item):
+                if os.path.isfile(path):
+                    sources[path] = os.path.relpath(path, base)
+    return sorted(sources.items())
+
+
+def _glob_base(pattern):
+    """ Return the directory part of `pattern` before any glob characters. """
+    parts = []
+    for part in os.path.dirname(pattern).split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or os.curdir
+
+
+def output_path(relpath, output_dir, suffix=OUTPUT_SUFFIX):
+    """ Return the path of the output file for a source's relative path. """
+    return os.path.join(output_dir, os.path.splitext(relpath)[0] + suffix)
+
+
+def _init_worker(md_options):
+    """ Build the Markdown instance reused by this worker. """
+    global _md
+    _md = markdown.Markdown(**md_options)
+
+
+def _convert_one(task):
+    """
+    Convert a single file with the worker's Markdown instance.
+
+    Returns a (source path, bytes read, error) tuple. Errors are returned
+    rather than raised so one bad file does not stop the whole batch.
+
+    """
+    src, dst, encoding = task
+    try:
+        _makedirs(os.path.dirname(dst))
+        _md.reset()
+        _md.convertFile(src, dst, encoding)
+        return src, os.path.getsize(src), None
+    except Exception, e:
+        return src, 0, '%s: %s' % (e.__class__.__name__, e)
+
+
+def _makedirs(path):
+    """ Create directory `path` unless it already exists. """
+    if path and not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            # Another worker may have just created it.
+            if not os.path.isdir(path):
+                raise
+
+
+def file_hash(path):
+    """ Return the md5 hex digest of the content of the file at `path`. """
+    digest = hashlib.md5()
+    f = open(path, 'rb')
+    try:
+        for chunk in iter(lambda: f.read(65536), ''):
+            digest.update(chunk)
+    finally:
+        f.close()
+    return digest.hexdigest()
+
+
+def options_fingerprint(md_options, encoding=None):
+    """ Return a digest of the options and engine version used to convert. """
+    # Extensions are fingerprinted as the cache does, by name or by class
+    # and configs, and the cache does not change the output.
+    items = [item for item in sorted(md_options.items())
+             if item[0] not in ('extensions', 'extension_configs',
+                                'cache_dir', 'cache_size')]
+    extensions = cache.fingerprint(md_options.get('extensions', []),
+                                   md_options.get('extension_configs', {}))
+    items += [('extensions', extensions), ('encoding', encoding),
+              ('version', markdown.version)]
+    return hashlib.md5(repr(items)).hexdigest()
+
+
+class Manifest:
+    """
+    The record of an incremental build.
+
+    For each source path the manifest stores the modification time and
+    content hash of the file, the fingerprint of the options it was
+    converted with and the path of its output. A source is only converted
+    again when one of those changed or its output went missing. The content
+    is only hashed when the modification time changed.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        # Whether an entry was added, removed or changed since loading
+        self.changed = False
+        if os.path.exists(path):
+            try:
+                f = open(path)
+                try:
+                    self.files = json.load(f)
+                finally:
+                    f.close()
+            except ValueError:
+                logger.warn('Ignoring corrupt manifest %s' % path)
+
+    def is_current(self, src, dst, fingerprint):
+        """ Return True if the output of `src` is up to date. """
+        entry = self.files.get(src)
+        if not entry or entry['fingerprint'] != fingerprint \
+                or entry['output'] != dst or not os.path.exists(dst):
+            return False
+        mtime = os.path.getmtime(src)
+        if entry['mtime'] == mtime:
+            return True
+        if entry['hash'] == file_hash(src):
+            # Touched, but not changed.
+            entry['mtime'] = mtime
+            self.changed = True
+            return True
+        return False
+
+    def update(self, src, dst, fingerprint):
+        """ Record that `src` was converted to `dst`. """
+        self.files[src] = {'mtime': os.path.getmtime(src),
+                           'hash': file_hash(src),
+                           'fingerprint': fingerprint,
+                           'output': dst}
+        self.changed = True
+
+    def prune(self, sources):
+        """ Forget sources no longer present and return their outputs. """
+        stale = [src for src in self.files if src not in sources]
+        if stale:
+            self.changed = True
+        return [self.files.pop(src)['output'] for src in stale]
+
+    def save(self):
+        """ Write the manifest, replacing the old one atomically. """
+        _makedirs(os.path.dirname(self.path))
+        tmp = '%s.%d.tmp' % (self.path, os.getpid())
+        f = open(tmp, 'w')
+        try:
+            json.dump(self.files, f)
+        finally:
+            f.close()
+        os.rename(tmp, self.path)
+        self.changed = False
+
+
+def convert_tree(inputs, output_dir, jobs=None, encoding=None,
+                 suffixes=SOURCE_SUFFIXES, incremental=False, **md_options):
+    """
+    Convert all Markdown files found in `inputs` into `output_dir`.
+
+    Keyword arguments:
+
+    * inputs: A list of directories, glob patterns or files.
+    * output_dir: Directory in which the input tree is mirrored.
+    * jobs: Number of worker processes. Defaults to the number of CPUs.
+      With 1, or where processes are unavailable, files are converted in
+      this process.
+    * encoding: Encoding of input and output files. Defaults to utf-8.
+    * suffixes: Suffixes of the files to convert in input directories.
+    * incremental: Only convert files changed since the last incremental
+      build, as recorded in the manifest in `output_dir`. Outputs of
+      sources which have disappeared are removed.
+    * Any arguments accepted by the Markdown class.
+
+    Returns: A dict with the number of `files` converted, the `bytes` read,
+    the number of up to date files `skipped`, the elapsed `seconds` and a
+    list of `errors` as (path, message) tuples.
+
+    """
+    start = time.time()
+    tasks = [(src, output_path(rel, output_dir), encoding)
+             for src, rel in find_sources(inputs, suffixes)]
+    outputs = dict([(src, dst) for src, dst, enc in tasks])
+    skipped = 0
+    if incremental:
+        manifest = Manifest(os.path.join(output_dir, MANIFEST_NAME))
+        fingerprint = options_fingerprint(md_options, encoding)
+        for dst in manifest.prune(outputs):
+            if os.path.exists(dst):
+                os.remove(dst)
+        total = len(tasks)
+        tasks = [task for task in tasks
+                 if not manifest.is_current(task[0], task[1], fingerprint)]
+        skipped = total - len(tasks)
+    if jobs is None:
+        jobs = multiprocessing and multiprocessing.cpu_count() or 1
+    jobs = min(jobs, len(tasks))
+
+    pool = None
+    if jobs > 1 and multiprocessing is not None:
+        try:
+            pool = multiprocessing.Pool(jobs, _init_worker, (md_options,))
+        except (OSError, NotImplementedError):
+            pool = None
+    if pool is not None:
+        chunksize = max(1, len(tasks) // (jobs * 4))
+        try:
+            results = list(pool.imap_unordered(_convert_one, tasks, chunksize))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _init_worker(md_options)
+        results = [_convert_one(task) for task in tasks]
+
+    stats = {'files': 0, 'bytes': 0, 'skipped': skipped, 'errors': []}
+    for src, size, error in results:
+        if error:
+            logger.error('Failed to convert %s: %s' % (src, error))
+            stats['errors'].append((src, error))
+        else:
+            stats['files'] += 1
+            stats['bytes'] += size
+            if incremental:
+                manifest.update(src, outputs[src], fingerprint)
+    if incremental and manifest.changed:
+        manifest.save()
+    stats['seconds'] = time.time() - start
+    return stats
+
+
+def _watched_dirs(inputs):
+    """ Return the directories which hold the `inputs`. """
+    dirs = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            dirs.add(item)
+        else:
+            dirs.add(_glob_base(item))
+    return sorted(dirs)
+
+
+def _in_dir(path, directory):
+    """ Whether `path` is `directory` or inside it. """
+    path = os.path.abspath(path)
+    directory = os.path.abspath(directory)
+    return path == directory or path.startswith(directory + os.sep)
+
+
+if pyinotify is not None:
+    class _SourceEvents(pyinotify.ProcessEvent):
+        """
+        Record whether an event may have changed the inputs. Events of
+        files in the output directory, such as the manifest and the
+        outputs, are left out, so that a build does not start another.
+
+        """
+
+        def my_init(self, output_dir):
+            self.output_dir = output_dir
+            self.changed = False
+
+        def process_default(self, event):
+            if not _in_dir(event.pathname, self.output_dir):
+                self.changed = True
+
+
+def watch(inputs, output_dir, interval=1.0, report=None, **kwargs):
+    """
+    Keep `output_dir` up to date with `inputs` until interrupted.
+
+    An incremental build is run at once and again whenever the inputs may
+    have changed. With pyinotify installed, the input directories are
+    watched for file system events, but for the output directory where it
+    is inside them. Otherwise the build is repeated every
+    `interval` seconds, which only costs a stat per unchanged file.
+
+    Keyword arguments:
+
+    * inputs, output_dir: As for `convert_tree`.
+    * interval: Seconds between checks without inotify.
+    * report: Called with the stats of every build that converted or failed
+      to convert at least one file.
+    * Any other arguments accepted by `convert_tree`.
+
+    """
+    kwargs['incremental'] = True
+    notifier = None
+    if pyinotify is not None:
+        wm = pyinotify.WatchManager()
+        mask = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO | \
+               pyinotify.IN_MOVED_FROM | pyinotify.IN_DELETE | \
+               pyinotify.IN_CREATE
+        events = _SourceEvents(output_dir=output_dir)
+        excluded = lambda path: _in_dir(path, output_dir)
+        for path in _watched_dirs(inputs):
+            wm.add_watch(path, mask, rec=True, auto_add=True,
+                         exclude_filter=excluded)
+        notifier = pyinotify.Notifier(wm, events,
+                                      timeout=int(interval * 1000))
+    try:
+        while 1:
+            stats = convert_tree(inputs, output_dir, **kwargs)
+            if report and (stats['files'] or stats['errors']):
+                report(stats)
+            if notifier is not None:
+                # Block until the inputs may have changed.
+                events.changed = False
+                while not events.changed:
+                    if notifier.check_events():
+                        notifier.read_events()
+                        notifier.process_events()
+            else:
+                time.sleep(interval)
+    finally:
+        if notifier is not None:
+            notifier.stop()
+
+
+def format_stats(stats):
+    """ Return a one line throughput report for the stats of a batch. """
+    seconds = max(stats['seconds'], 1e-6)
+    report = 'Converted %d files (%.1f KB) in %.2fs: %.1f files/s, %.1f KB/s' % \
+             (stats['files'], stats['bytes'] / 1024.0, stats['seconds'],
+              stats['files'] / seconds, stats['bytes'] / 1024.0 / seconds)
+    if stats.get('skipped'):
+        report += ', %d up to date' % stats['skipped']
+    if stats['errors']:
+        report += ', %d failed' % len(stats['errors'])
+    return report
@@ -0,0 +1,24 @@
+"""
+BENCHMARKS
+=============================================================================
+
+Measure the speed and memory use of Python-Markdown on synthetic documents.
+
+The documents come from deterministic generators in `corpus`, so two runs
+with the same options convert exactly the same text and their results can
+be compared. Each document kind is converted with each extension set in
+`CONFIGS`, including the exact configuration used by the Notes app, and the
+results are reported as JSON.
+
+From the command line:
+
+    python -m markdown.benchmarks [options]
+
+As a library:
+
+    from markdown import benchmarks
+    results = benchmarks.run_all(size=50000)
+
+"""
+
+from runner import CONFIGS, NOTES_CONFIG, run_case, run_all
@@ -0,0 +1,83 @@
+"""
+COMMAND-LINE SPECIFIC STUFF
+=============================================================================
+
+"""
+
+import sys
+import optparse
+from markdown import benchmarks
+from markdown.benchmarks.corpus import GENERATORS
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+def parse_options():
+    """
+    Define and parse `optparse` options for command-line usage.
+    """
+    usage = "%prog [options]"
+    desc = "Benchmark Python-Markdown on synthetic documents. Results are " \
+           "written as JSON."
+    parser = optparse.OptionParser(usage=usage, description=desc)
+    parser.add_option("-f", "--file", dest="filename", default=None,
+                      metavar="OUTPUT_FILE",
+                      help="Write results to OUTPUT_FILE. Defaults to STDOUT.")
+    parser.add_option("-c", "--corpus", action="append", dest="corpora",
+                      metavar="CORPUS",
+                      help="Run CORPUS only (repeatable). One of: %s."
+                           % ", ".join(sorted(GENERATORS.keys())))
+    parser.add_option("-x", "--config", action="append", dest="configs",
+                      metavar="CONFIG",
+                      help="Run extension set CONFIG only (repeatable). "
+                           "One of: %s."
+                           % ", ".join(sorted(benchmarks.CONFIGS.keys())))
+    parser.add_option("-s", "--size", dest="size", type="int", default=20000,
+                      help="Approximate characters per document. "
+                           "Default: 20000.")
+    parser.add_option("-n", "--count", dest="count", type="int", default=5,
+                      help="Documents converted per round. Default: 5.")
+    parser.add_option("-r", "--repeat", dest="repeat", type="int", default=3,
+                      help="Rounds per case; the fastest counts. Default: 3.")
+    parser.add_option("--seed", dest="seed", type="int", default=0,
+                      help="Seed of the first document. Default: 0.")
+    parser.add_option("--no-isolate", dest="isolate", action="store_false",
+                      default=True,
+                      help="Run all cases in this process.")
+
+    (options, args) = parser.parse_args()
+    for name in options.corpora or []:
+        if name not in GENERATORS:
+            parser.error("unknown corpus: %s" % name)
+    for name in options.configs or []:
+        if name not in benchmarks.CONFIGS:
+            parser.error("unknown config: %s" % name)
+    return options
+
+
+def run():
+    """Run the benchmarks from the command line."""
+    options = parse_options()
+    results = benchmarks.run_all(corpora=options.corpora,
+                                 configs=options.configs,
+                                 size=options.size,
+                                 seed=options.seed,
+                                 count=options.count,
+                                 repeat=options.repeat,
+                                 isolate=options.isolate)
+    for r in results['results']:
+        sys.stderr.write('%-20s %-14s %8.1f docs/s %10.0f bytes/s %8s KB\n'
+                         % (r['corpus'], r['config'], r['docs_per_sec'],
+                            r['bytes_per_sec'], r['peak_rss_kb']))
+    if options.filename:
+        output = open(options.filename, 'w')
+        json.dump(results, output, indent=2, sort_keys=True)
+        output.close()
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+if __name__ == '__main__':
+    run()
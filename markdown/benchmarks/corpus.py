@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic corpus generators for the benchmarks.
+
+Every generator takes the approximate `size` of the document in characters
+and a `seed`, and returns a unicode string. The same arguments always give
+the same document. Generators are registered in `GENERATORS` by name.
+
+Realistic documents mimic the notes people write. Adversarial documents
+stress the known slow paths of the parser: unmatched brackets for the link
+patterns, long runs of emphasis characters and deeply nested quoting.
+
+"""
+
+import random
+
+WORDS = (u"the of and to in is that for it as was with be by on not he this "
+         u"are or his from at which but have an they you were her she there "
+         u"markdown parser block inline pattern element tree serializer note "
+         u"extension header paragraph list quote code table footnote HTML CSS "
+         u"API URL JSON naïve café résumé").split()
+
+GENERATORS = {}
+
+
+def generator(name):
+    """ Register the decorated function in GENERATORS under `name`. """
+    def register(func):
+        GENERATORS[name] = func
+        return func
+    return register
+
+
+def _words(r, n):
+    return u' '.join([r.choice(WORDS) for i in range(n)])
+
+
+def _sentence(r):
+    s = _words(r, r.randint(6, 18))
+    return s[0].upper() + s[1:] + u'.'
+
+
+def _paragraph(r):
+    return u' '.join([_sentence(r) for i in range(r.randint(2, 6))])
+
+
+def _fill(size, seed, make_block, sep=u'\n\n'):
+    """ Join blocks from `make_block(r, i)` until `size` is reached. """
+    r = random.Random(seed)
+    blocks = []
+    length = 0
+    i = 0
+    while length < size:
+        block = make_block(r, i)
+        blocks.append(block)
+        length += len(block) + len(sep)
+        i += 1
+    return sep.join(blocks)
+
+
+@generator('prose')
+def prose(size, seed=0):
+    """ Long prose with headers and some inline markup. """
+    def block(r, i):
+        if i % 8 == 0:
+            return u'## %s' % _words(r, 4).title()
+        text = _paragraph(r)
+        words = text.split(u' ')
+        for j in range(0, len(words), 9):
+            words[j] = r.choice([u'*%s*', u'**%s**', u'`%s`', u'%s'])\
+                       % words[j]
+        return u' '.join(words)
+    return _fill(size, seed, block)
+
+
+@generator('nested_lists')
+def nested_lists(size, seed=0):
+    """ Outlines nested up to eight levels deep. """
+    def block(r, i):
+        lines = []
+        level = 0
+        for j in range(r.randint(10, 40)):
+            level = max(0, min(7, level + r.choice([-1, 0, 0, 1])))
+            marker = r.choice([u'*', u'-', u'1.'])
+            lines.append(u'%s%s %s' % (u'    ' * level, marker,
+                                        _words(r, r.randint(3, 10))))
+        return u'\n'.join(lines)
+    return _fill(size, seed, block)
+
+
+@generator('link_dense')
+def link_dense(size, seed=0):
+    """ Paragraphs in which every few words are links or references. """
+    def block(r, i):
+        words = _paragraph(r).split(u' ')
+        for j in range(0, len(words), 3):
+            kind = r.randint(0, 3)
+            if kind == 0:
+                words[j] = u'[%s](http://example.com/%d "Title %d")' \
+                           % (words[j], j, j)
+            elif kind == 1:
+                words[j] = u'[%s][ref%d]' % (words[j], j % 20)
+            elif kind == 2:
+                words[j] = u'<http://example.com/auto/%d>' % j
+            else:
+                words[j] = u'![%s](/img/%d.png)' % (words[j], j)
+        return u' '.join(words)
+    text = _fill(size, seed, block)
+    refs = [u'[ref%d]: http://example.com/ref/%d' % (i, i) for i in range(20)]
+    return text + u'\n\n' + u'\n'.join(refs)
+
+
+@generator('huge_table')
+def huge_table(size, seed=0):
+    """ One table with many rows (needs the tables extension). """
+    r = random.Random(seed)
+    cols = 6
+    lines = [u' | '.join([u'Column %d' % c for c in range(cols)]),
+             u' | '.join([u'---'] * cols)]
+    length = 0
+    while length < size:
+        row = u' | '.join([_words(r, r.randint(1, 3)) for c in range(cols)])
+        lines.append(row)
+        length += len(row) + 1
+    return u'\n'.join(lines)
+
+
+@generator('many_fences')
+def many_fences(size, seed=0):
+    """ Short paragraphs between many fenced and indented code blocks. """
+    code = [u'def f%(n)d(x):\n    return x * %(n)d\n',
+            u'for (int i = 0; i < %(n)d; i++) {\n    total += i;\n}\n',
+            u'SELECT * FROM t%(n)d WHERE id = 1;\n']
+    def block(r, i):
+        snippet = r.choice(code) % {'n': i}
+        if i % 3 == 0:
+            return u'\n'.join([u'    ' + l for l in snippet.split(u'\n')])
+        lang = r.choice([u'python', u'c', u'sql', u''])
+        return u'%s\n\n~~~%s\n%s~~~' % (_sentence(r), lang, snippet)
+    return _fill(size, seed, block)
+
+
+@generator('footnotes')
+def footnotes(size, seed=0):
+    """ Paragraphs full of footnote references, defined at the end. """
+    count = [0]
+    def block(r, i):
+        words = _paragraph(r).split(u' ')
+        for j in range(0, len(words), 6):
+            count[0] += 1
+            words[j] += u'[^n%d]' % count[0]
+        return u' '.join(words)
+    text = _fill(size * 2 / 3, seed, block)
+    r = random.Random(seed + 1)
+    notes = [u'[^n%d]: %s' % (i + 1, _sentence(r)) for i in range(count[0])]
+    return text + u'\n\n' + u'\n'.join(notes)
+
+
+@generator('abbreviations')
+def abbreviations(size, seed=0):
+    """ Prose using a few dozen defined abbreviations (abbr extension). """
+    abbrs = [u'AB%d' % i for i in range(40)]
+    def block(r, i):
+        words = _paragraph(r).split(u' ')
+        for j in range(0, len(words), 4):
+            words[j] = r.choice(abbrs)
+        return u' '.join(words)
+    text = _fill(size, seed, block)
+    defs = [u'*[%s]: Abbreviation number %d' % (a, i)
+            for i, a in enumerate(abbrs)]
+    return text + u'\n\n' + u'\n'.join(defs)
+
+
+@generator('notes_meta')
+def notes_meta(size, seed=0):
+    """ A note as stored by the Notes app: meta header, TOC and body. """
+    r = random.Random(seed)
+    header = [u'Title: %s' % _words(r, 4).title(),
+              u'Author: %s' % _words(r, 2).title(),
+              u'        %s' % _words(r, 2).title(),
+              u'Date: 2013-01-01',
+              u'Tags: %s' % _words(r, 5),
+              u'', u'[TOC]', u'']
+    body = prose(size, seed)
+    return u'\n'.join(header) + u'\n' + body
+
+
+@generator('unmatched_brackets')
+def unmatched_brackets(size, seed=0):
+    """ Adversarial: pasted logs full of unmatched `[` and `(`. """
+    def block(r, i):
+        parts = []
+        for j in range(r.randint(5, 15)):
+            parts.append(r.choice([u'[', u'(', u'[[', u'](', u'[x]',
+                                   u'(%d' % j, _words(r, 1)]))
+        return u' '.join(parts)
+    return _fill(size, seed, block, u'\n')
+
+
+@generator('emphasis_heavy')
+def emphasis_heavy(size, seed=0):
+    """ Adversarial: prose thick with unbalanced `*` and `_`. """
+    def block(r, i):
+        words = _paragraph(r).split(u' ')
+        for j in range(len(words)):
+            if r.random() < 0.4:
+                mark = r.choice([u'*', u'_', u'**', u'__', u'***'])
+                if r.random() < 0.5:
+                    words[j] = mark + words[j]
+                else:
+                    words[j] = words[j] + mark
+        return u' '.join(words)
+    return _fill(size, seed, block)
+
+
+@generator('quote_thread')
+def quote_thread(size, seed=0):
+    """ Adversarial: an email thread, each reply quoted one level deeper. """
+    def block(r, i):
+        prefix = u'> ' * i
+        lines = [u'On %s, %s wrote:' % (_words(r, 2), _words(r, 2).title())]
+        for j in range(r.randint(1, 3)):
+            lines.append(u'')
+            lines.extend(_words(r, 8) for k in range(r.randint(2, 8)))
+        return u'\n'.join([(prefix + line).rstrip() for line in lines])
+    return _fill(size, seed, block, u'\n')
@@ -0,0 +1,141 @@
+"""
+Run the benchmarks and collect the results.
+
+Each case converts a set of generated documents of one kind with one
+extension set. Cases run in a child process where possible, so the peak
+resident memory reported for a case is not inflated by the cases before it.
+
+"""
+
+import sys
+import time
+import markdown
+from corpus import GENERATORS
+try:
+    import resource
+except ImportError:
+    # Not available on Windows.
+    resource = None
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+# The configuration of the `MARKDOWN` converter of the Notes app.
+NOTES_CONFIG = {
+    'extensions': ['extra', 'toc', 'sane_lists', 'meta', 'nl2br'],
+    'safe_mode': 'replace',
+    'output_format': 'html5',
+    'html_replacement_text': '<em class="alert">No raw HTML please.</em>',
+}
+
+CONFIGS = {
+    'core': {},
+    'extra': {'extensions': ['extra']},
+    'toc_headerid': {'extensions': ['toc', 'headerid']},
+    'codehilite': {'extensions': ['fenced_code', 'codehilite']},
+    'notes': NOTES_CONFIG,
+}
+
+
+def _peak_rss():
+    """ Return the peak resident memory of this process in KB or None. """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # Reported in bytes rather than KB.
+        peak = peak / 1024
+    return peak
+
+
+def _measure(corpus, config, size, seed, count, repeat):
+    """ Convert the documents of one case and return its result dict. """
+    docs = [GENERATORS[corpus](size, seed + i) for i in range(count)]
+    nbytes = sum([len(doc.encode('utf-8')) for doc in docs])
+    md = markdown.Markdown(**CONFIGS[config])
+    rss_before = _peak_rss()
+
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        for doc in docs:
+            md.convert(doc)
+            md.reset()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    rss_after = _peak_rss()
+    seconds = max(best, 1e-9)
+    result = {'corpus': corpus, 'config': config, 'size': size,
+              'seed': seed, 'docs': count, 'bytes': nbytes,
+              'repeat': repeat, 'seconds': best,
+              'docs_per_sec': count / seconds,
+              'bytes_per_sec': nbytes / seconds,
+              'peak_rss_kb': rss_after, 'rss_growth_kb': None}
+    if rss_before is not None:
+        result['rss_growth_kb'] = rss_after - rss_before
+    return result
+
+
+def _child(queue, args):
+    """ Run `_measure` in a child process and send back the result. """
+    try:
+        queue.put(_measure(*args))
+    except Exception, e:
+        queue.put({'error': '%s: %s' % (e.__class__.__name__, e)})
+
+
+def run_case(corpus, config, size=20000, seed=0, count=5, repeat=3,
+             isolate=True):
+    """
+    Benchmark one document kind with one extension set.
+
+    Keyword arguments:
+
+    * corpus: Name of a generator in `corpus.GENERATORS`.
+    * config: Name of an extension set in `CONFIGS`.
+    * size: Approximate size of each document in characters.
+    * seed: Seed of the first document. Document `i` uses `seed + i`.
+    * count: Number of documents converted per round.
+    * repeat: Number of rounds. The fastest round is reported.
+    * isolate: Run in a child process so memory figures are per case.
+
+    Returns: A dict with the case parameters, the `seconds` of the fastest
+    round, `docs_per_sec`, `bytes_per_sec`, `peak_rss_kb` and
+    `rss_growth_kb` (peak memory added while converting).
+
+    """
+    args = (corpus, config, size, seed, count, repeat)
+    if isolate and multiprocessing is not None:
+        queue = multiprocessing.Queue()
+        proc = multiprocessing.Process(target=_child, args=(queue, args))
+        proc.start()
+        result = queue.get()
+        proc.join()
+        if 'error' in result:
+            raise RuntimeError('Benchmark %s/%s failed: %s'
+                               % (corpus, config, result['error']))
+        return result
+    return _measure(*args)
+
+
+def run_all(corpora=None, configs=None, **kwargs):
+    """
+    Benchmark every combination of `corpora` and `configs`.
+
+    Both default to all that are defined. Other keyword arguments are
+    passed to `run_case`. Returns a dict ready to be dumped as JSON.
+
+    """
+    corpora = corpora or sorted(GENERATORS.keys())
+    configs = configs or sorted(CONFIGS.keys())
+    results = []
+    for corpus in corpora:
+        for config in configs:
+            results.append(run_case(corpus, config, **kwargs))
+    return {'markdown_version': markdown.version,
+            'python_version': sys.version.split()[0],
+            'platform': sys.platform,
+            'results': results}
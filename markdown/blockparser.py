@@ -44,10 +44,18 @@ class BlockParser:
 
     def __init__(self, markdown):
         self.blockprocessors = odict.OrderedDict()
-        self.state = State()
         self.markdown = markdown
 
-    def parseDocument(self, lines):
+    def _get_state(self):
+        context = self.markdown.context
+        if context.parser_state is None:
+            context.parser_state = State()
+        return context.parser_state
+
+    # The State of the document being parsed, kept in its RenderContext
+    state = property(_get_state)
+
+    def parseDocument(self, lines, max_blocks=None, max_chars=None):
         """ Parse a markdown document into an ElementTree. 
         
         Given a list of lines, an ElementTree object (not just a parent Element)
@@ -56,11 +64,67 @@ class BlockParser:
         
         This should only be called on an entire document, not pieces.
 
+        Given ``max_blocks`` or ``max_chars``, only that many children of
+        the root element are kept, or those up to and including the one which
+        brings its text to that many characters. Blocks are parsed only until
+        the child after them starts, so the last one kept is complete.
+
         """
         # Create a ElementTree from the lines
-        self.root = util.etree.Element(self.markdown.doc_tag)
-        self.parseChunk(self.root, '\n'.join(lines))
-        return util.etree.ElementTree(self.root)
+        root = util.etree.Element(self.markdown.doc_tag)
+        if max_blocks is None and max_chars is None:
+            self.parseChunk(root, '\n'.join(lines))
+        else:
+            self._parseExcerpt(root, '\n'.join(lines).split('\n\n'),
+                               max_blocks, max_chars)
+        return util.etree.ElementTree(root)
+
+    def _parseExcerpt(self, root, blocks, max_blocks, max_chars):
+        """ Parse ``blocks`` one at a time until the budget is met.
+
+        Parsing goes on until root has a child after the last one kept, as
+        later blocks may still add to that one: a code block continued after
+        a blank line or a list item made loose, for instance. The children
+        after it are then dropped.
+
+        """
+        blocks.reverse()
+        # The number of children of root kept, once known
+        keep = max_blocks
+        # The characters of text of the children of root before `counted`
+        chars = 0
+        counted = 0
+        # Text is joined at the end, as for a whole document, and before
+        # that only while it is counted.
+        context = self.markdown.context
+        context.parse_depth += 1
+        while blocks:
+            self.parseBlocks(root, [blocks.pop()])
+            if max_chars is not None and (keep is None or counted < keep):
+                self.joinText()
+                while counted < len(root) and (keep is None or counted < keep):
+                    length = self._textLength(root[counted])
+                    if chars + length >= max_chars:
+                        keep = counted + 1
+                    elif counted < len(root) - 1:
+                        # Not the last child, which later blocks may extend
+                        chars += length
+                        counted += 1
+                        continue
+                    break
+            if keep is not None and len(root) > keep:
+                del root[keep:]
+                context.excerpt_cut = True
+                break
+        context.parse_depth -= 1
+        self.joinText()
+
+    def _textLength(self, element):
+        """ Return the number of characters of text in ``element``. """
+        length = len(element.text or '')
+        for child in element:
+            length += self._textLength(child) + len(child.tail or '')
+        return length
 
     def parseChunk(self, parent, text):
         """ Parse a chunk of markdown text and attach to given etree node. 
@@ -88,11 +152,99 @@ class BlockParser:
         block.
 
         """
+        context = self.markdown.context
+        context.parse_depth += 1
+        if self.markdown.stats is not None:
+            self._parseBlocksWithStats(parent, blocks)
+        else:
+            self._parseBlocks(parent, blocks)
+        context.parse_depth -= 1
+        if not context.parse_depth:
+            self.joinText()
+
+    def _parseBlocks(self, parent, blocks):
+        """ Step each block through the processors until one runs. """
+        while blocks:
+            self._runBlock(parent, blocks)
+
+    def _parseBlocksWithStats(self, parent, blocks):
+        """ Same as ``parseBlocks`` but time each test and run call. """
         while blocks:
-            for processor in self.blockprocessors.values():
-                if processor.test(parent, blocks[0]):
-                    if processor.run(parent, blocks) is not False:
-                        # run returns True or None
-                        break
+            self._runBlockWithStats(parent, blocks)
 
+    def runBlock(self, parent, blocks):
+        """ Step the first of ``blocks`` through the processors until one runs.
 
+        This is a single step of ``parseBlocks``, for a BlockProcessor which
+        parses part of a block itself and needs to see what the processors
+        left of the block. Like ``parseBlocks`` it alters ``blocks`` in place.
+        It is only meant to be called while parsing, from a processor.
+
+        """
+        if self.markdown.stats is not None:
+            self._runBlockWithStats(parent, blocks)
+        else:
+            self._runBlock(parent, blocks)
+
+    def _runBlock(self, parent, blocks):
+        for processor in self.blockprocessors.values():
+            if processor.test(parent, blocks[0]):
+                if processor.run(parent, blocks) is not False:
+                    # run returns True or None
+                    break
+
+    def _runBlockWithStats(self, parent, blocks):
+        stats = self.markdown.stats
+        for name, processor in self.blockprocessors.items():
+            if stats.time('blocktest', name, processor.test,
+                          parent, blocks[0]):
+                if stats.time('blockprocessor', name, processor.run,
+                              parent, blocks) is not False:
+                    # run returns True or None
+                    break
+
+    def addText(self, element, text, tail=False):
+        """ Append ``text`` to the text (or the tail) of ``element``.
+
+        Rather than being concatenated to the element's text each time, the
+        pieces are kept in a list and joined once, when the outermost call
+        to ``parseBlocks`` returns. Until then the element keeps only its
+        text from before the first piece was added, so any code which needs
+        the whole of it during block parsing must read it with ``getText``.
+
+        """
+        key = (id(element), tail)
+        pending = self.markdown.context.text_pieces.get(key)
+        if pending is None:
+            pending = (element, tail, [self._getText(element, tail) or ''])
+            self.markdown.context.text_pieces[key] = pending
+        pending[2].append(text)
+
+    def getText(self, element, tail=False):
+        """ Return the text (or the tail) of ``element``, pieces included. """
+        pending = self.markdown.context.text_pieces.pop((id(element), tail),
+                                                        None)
+        if pending is not None:
+            self._setText(*pending)
+        return self._getText(element, tail)
+
+    def joinText(self):
+        """ Join the pieces of text of all elements and set their text. """
+        text_pieces = self.markdown.context.text_pieces
+        for pending in text_pieces.values():
+            self._setText(*pending)
+        text_pieces.clear()
+
+    def _getText(self, element, tail):
+        if tail:
+            return element.tail
+        return element.text
+
+    def _setText(self, element, tail, pieces):
+        text = ''.join(pieces)
+        if isinstance(pieces[0], util.AtomicString):
+            text = util.AtomicString(text)
+        if tail:
+            element.tail = text
+        else:
+            element.text = text
@@ -45,6 +45,11 @@ class BlockProcessor:
     whether the current block should be processed by this processor. If the
     test passes, the parser will call the processors ``run`` method.
 
+    Text appended with ``parser.addText`` is only joined into the element
+    when the outermost ``parseBlocks`` returns. Until then the ``text`` and
+    ``tail`` of an element already in the tree may lack pieces, so a
+    processor which reads them must do so with ``parser.getText``.
+
     """
 
     def __init__(self, parser):
@@ -79,6 +84,13 @@ class BlockProcessor:
                 lines[i] = lines[i][self.tab_length*level:]
         return '\n'.join(lines)
 
+    def get_processor(self, parent, block):
+        """ Return the first block processor whose test passes for `block`. """
+        for processor in self.parser.blockprocessors.values():
+            if processor.test(parent, block):
+                return processor
+        return None
+
     def test(self, parent, block):
         """ Test for block type. Must be overridden by subclasses. 
         
@@ -174,12 +186,13 @@ class ListIndentProcessor(BlockProcessor):
         elif len(sibling) and sibling[-1].tag in self.ITEM_TYPES:
             # The parent is a list (``ol`` or ``ul``) which has children.
             # Assume the last child li is the parent of this block.
-            if sibling[-1].text:
+            text = self.parser.getText(sibling[-1])
+            if text:
                 # If the parent li has text, that text needs to be moved to a p
                 # The p must be 'inserted' at beginning of list in the event
                 # that other children already exist i.e.; a nested sublist.
                 p = util.etree.Element('p')
-                p.text = sibling[-1].text
+                p.text = text
                 sibling[-1].text = ''
                 sibling[-1].insert(0, p)
             self.parser.parseChunk(sibling[-1], block)
@@ -237,7 +250,7 @@ class CodeBlockProcessor(BlockProcessor):
             # linebreaks removed from the split into a list.
             code = sibling[0]
             block, theRest = self.detab(block)
-            code.text = util.AtomicString('%s\n%s\n' % (code.text, block.rstrip()))
+            self.parser.addText(code, '\n%s\n' % block.rstrip())
         else:
             # This is a new codeblock. Create the elements and insert text.
             pre = util.etree.SubElement(parent, 'pre')
@@ -254,6 +267,11 @@ class CodeBlockProcessor(BlockProcessor):
 class BlockQuoteProcessor(BlockProcessor):
 
     RE = re.compile(r'(^|\n)[ ]{0,3}>[ ]?(.*)')
+    # One level of quoting at the start of a line (see ``clean``).
+    # ``group(1)`` is set when nothing but whitespace follows the ``>``.
+    MARKER_RE = re.compile(r'[ ]{0,3}>[ ]?(\s*$)?', re.UNICODE)
+    # The rest of a line is a lone ``>``, which ``clean`` removes entirely
+    LONE_RE = re.compile(r'\s*>\s*$', re.UNICODE)
 
     def test(self, parent, block):
         return bool(self.RE.search(block))
@@ -261,13 +279,29 @@ class BlockQuoteProcessor(BlockProcessor):
     def run(self, parent, blocks):
         block = blocks.pop(0)
         m = self.RE.search(block)
-        if m:
-            before = block[:m.start()] # Lines before blockquote
-            # Pass lines before blockquote in recursively for parsing forst.
-            self.parser.parseBlocks(parent, [before])
-            # Remove ``> `` from begining of each line.
-            block = '\n'.join([self.clean(line) for line in 
-                            block[m.start():].split('\n')])
+        if not m:
+            self.parse_quote(parent, [(line, []) for line in 
+                                      block.split('\n')], 1)
+            return
+        before = block[:m.start()] # Lines before blockquote
+        # Pass lines before blockquote in recursively for parsing forst.
+        self.parser.parseBlocks(parent, [before])
+        # Find where the text of each line begins at each level of quoting.
+        lines = [(line, self.get_offsets(line)) for line in
+                 block[m.start():].split('\n')]
+        self.parse_quote(parent, lines, 1)
+
+    def parse_quote(self, parent, lines, level):
+        """
+        Parse the `lines` of a blockquote, which are `level` quotes deep.
+
+        Each of the `lines` is a tuple of the line and its offsets from
+        ``get_offsets``. Blocks with no nested quoting are parsed in runs.
+        A block with nested quoting is parsed by ``parse_block`` from the
+        same lines, so that the offsets of each line are found only once
+        however deep the quoting.
+
+        """
         sibling = self.lastChild(parent)
         if sibling and sibling.tag == "blockquote":
             # Previous block was a blockquote so set that as this blocks parent
@@ -278,9 +312,91 @@ class BlockQuoteProcessor(BlockProcessor):
         # Recursively parse block with blockquote as parent.
         # change parser state so blockquotes embedded in lists use p tags
         self.parser.state.set('blockquote')
-        self.parser.parseChunk(quote, block)
+        # As ``get_text`` for each line
+        text = '\n'.join([line[offsets[min(level, len(offsets)) - 1]:]
+                          if offsets else line for line, offsets in lines])
+        blocks = []
+        start = 0
+        for block in text.split('\n\n'):
+            end = start + block.count('\n') + 1
+            if self.RE.search(block):
+                if blocks:
+                    self.parser.parseBlocks(quote, blocks)
+                    blocks = []
+                self.parse_block(quote, block, lines, start, end, level)
+            else:
+                blocks.append(block)
+            # Skip the blank line which ended the block
+            start = end + 1
+        if blocks:
+            self.parser.parseBlocks(quote, blocks)
         self.parser.state.reset()
 
+    def parse_block(self, quote, block, lines, start, end, level):
+        """
+        Parse a `block` of a quote with nested quoting.
+
+        The `block` is the text of `lines[start:end]` at `level`. This is
+        what ``parseBlocks`` would do with it, except that where this
+        processor would run on what is left of the block, the nested quote
+        is parsed from `lines` one level deeper instead.
+
+        """
+        while self.get_processor(quote, block) is not self:
+            blocks = [block]
+            self.parser.runBlock(quote, blocks)
+            if len(blocks) == 1 and 0 < len(blocks[0]) < len(block) and \
+                    block.endswith(blocks[0]) and \
+                    block[-len(blocks[0]) - 1] == '\n' and \
+                    self.RE.search(blocks[0]):
+                # The processor took whole lines off the front of the block
+                # and left the nested quote.
+                start += block.count('\n', 0, len(block) - len(blocks[0]))
+                block = blocks[0]
+            else:
+                if blocks:
+                    self.parser.parseBlocks(quote, blocks)
+                return
+        # As ``run`` would, from the offsets already found.
+        m = self.RE.search(block)
+        self.parser.parseBlocks(quote, [block[:m.start()]])
+        nested = lines[start + block.count('\n', 0, m.end(1)):end]
+        if m.group(1):
+            # ``run`` keeps the newline before the quote as an empty line
+            nested.insert(0, ('', []))
+        self.parse_quote(quote, nested, level + 1)
+
+    def get_offsets(self, line):
+        """
+        Return where the text of `line` begins at each level of quoting.
+
+        The text at level ``n`` is ``line[offsets[n-1]:]``, which is what
+        ``clean`` leaves of the line after removing ``n`` levels.
+
+        """
+        offsets = []
+        pos = 0
+        while 1:
+            m = self.MARKER_RE.match(line, pos)
+            if not m:
+                if self.LONE_RE.match(line, pos):
+                    # Indented too far to be a marker, but still removed
+                    offsets.append(len(line))
+                break
+            if m.group(1) is not None:
+                offsets.append(len(line))
+                break
+            pos = m.end()
+            offsets.append(pos)
+        return offsets
+
+    def get_text(self, line, offsets, level):
+        """ Return the text of `line` with `level` levels of quoting removed. """
+        if not offsets:
+            # A lazy line, which ``clean`` leaves as it is
+            return line
+        return line[offsets[min(level, len(offsets)) - 1]:]
+
     def clean(self, line):
         """ Remove ``>`` from beginning of a line. """
         m = self.RE.match(line)
@@ -314,7 +430,8 @@ class OListProcessor(BlockProcessor):
 
     def run(self, parent, blocks):
         # Check fr multiple items in one block.
-        items = self.get_items(blocks.pop(0))
+        block = blocks.pop(0)
+        items = self.get_items(block)
         sibling = self.lastChild(parent)
 
         if sibling and sibling.tag in self.SIBLING_TAGS:
@@ -322,18 +439,19 @@ class OListProcessor(BlockProcessor):
             lst = sibling
             # make sure previous item is in a p- if the item has text, then it
             # it isn't in a p
-            if lst[-1].text: 
+            text = self.parser.getText(lst[-1])
+            if text: 
                 # since it's possible there are other children for this sibling,
                 # we can't just SubElement the p, we need to insert it as the 
                 # first item
                 p = util.etree.Element('p')
-                p.text = lst[-1].text
+                p.text = text
                 lst[-1].text = ''
                 lst[-1].insert(0, p)
             # if the last item has a tail, then the tail needs to be put in a p
             # likely only when a header is not followed by a blank line
             lch = self.lastChild(lst[-1])
-            if lch is not None and lch.tail:
+            if lch is not None and self.parser.getText(lch, tail=True):
                 p = util.etree.SubElement(lst[-1], 'p')
                 p.text = lch.tail.lstrip()
                 lch.tail = ''
@@ -355,8 +473,10 @@ class OListProcessor(BlockProcessor):
             # This is a new list so create parent with appropriate tag.
             lst = util.etree.SubElement(parent, self.TAG)
             # Check if a custom start integer is set
-            if not self.parser.markdown.lazy_ol and self.STARTSWITH !='1':
-                lst.attrib['start'] = self.STARTSWITH
+            if not self.parser.markdown.lazy_ol:
+                start = self.get_start(block)
+                if start != '1':
+                    lst.attrib['start'] = start
 
         self.parser.state.set('list')
         # Loop through items in block, recursively parsing each with the
@@ -371,19 +491,22 @@ class OListProcessor(BlockProcessor):
                 self.parser.parseBlocks(li, [item])
         self.parser.state.reset()
 
+    def get_start(self, block):
+        """ Return the number (a string) the list of `block` starts with. """
+        if self.TAG == 'ol':
+            # Detect the integer value of first list item
+            m = self.CHILD_RE.match(block)
+            if m:
+                return re.match(r'\d+', m.group(1)).group()
+        return self.STARTSWITH
+
     def get_items(self, block):
         """ Break a block into list items. """
         items = []
         for line in block.split('\n'):
             m = self.CHILD_RE.match(line)
             if m:
-                # This is a new list item
-                # Check first item for the start index
-                if not items and self.TAG=='ol':
-                    # Detect the integer value of first list item
-                    INTEGER_RE = re.compile('(\d+)')
-                    self.STARTSWITH = INTEGER_RE.match(m.group(1)).group()
-                # Append to the list
+                # This is a new list item. Append to the list
                 items.append(m.group(3))
             elif self.INDENT_RE.match(line):
                 # This is an indented (possibly nested) item.
@@ -471,23 +594,22 @@ class HRProcessor(BlockProcessor):
         # No atomic grouping in python so we simulate it here for performance.
         # The regex only matches what would be in the atomic group - the HR.
         # Then check if we are at end of block or if next char is a newline.
-        if m and (m.end() == len(block) or block[m.end()] == '\n'):
-            # Save match object on class instance so we can use it later.
-            self.match = m
-            return True
-        return False
+        return bool(m) and (m.end() == len(block) or block[m.end()] == '\n')
 
     def run(self, parent, blocks):
         block = blocks.pop(0)
+        # Search again rather than keep the match of `test` on the instance,
+        # which other threads share.
+        m = self.SEARCH_RE.search(block)
         # Check for lines in block before hr.
-        prelines = block[:self.match.start()].rstrip('\n')
+        prelines = block[:m.start()].rstrip('\n')
         if prelines:
             # Recursively parse lines before hr so they get parsed first.
             self.parser.parseBlocks(parent, [prelines])
         # create hr
         hr = util.etree.SubElement(parent, 'hr')
         # check for lines in block after hr.
-        postlines = block[self.match.end():].lstrip('\n')
+        postlines = block[m.end():].lstrip('\n')
         if postlines:
             # Add lines after hr to master blocks for later parsing.
             blocks.insert(0, postlines)
@@ -514,7 +636,7 @@ class EmptyBlockProcessor(BlockProcessor):
             if sibling and sibling.tag == 'pre' and sibling[0] and \
                     sibling[0].tag == 'code':
                 # Last block is a codeblock. Append to preserve whitespace.
-                sibling[0].text = util.AtomicString('%s/n/n/n' % sibling[0].text )
+                self.parser.addText(sibling[0], '/n/n/n')
 
 
 class ParagraphProcessor(BlockProcessor):
@@ -540,13 +662,13 @@ class ParagraphProcessor(BlockProcessor):
                 if sibling is not None:
                     # Insetrt after sibling.
                     if sibling.tail:
-                        sibling.tail = '%s\n%s' % (sibling.tail, block)
+                        self.parser.addText(sibling, '\n%s' % block, tail=True)
                     else:
                         sibling.tail = '\n%s' % block
                 else:
                     # Append to parent.text
                     if parent.text:
-                        parent.text = '%s\n%s' % (parent.text, block)
+                        self.parser.addText(parent, '\n%s' % block)
                     else:
                         parent.text = block.lstrip()
             else:
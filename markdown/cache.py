@@ -0,0 +1,198 @@
+"""
+PARSE CACHE
+=============================================================================
+
+Keep the html of converted files in a directory, so that converting a file
+which did not change costs about as much as hashing it.
+
+    md = markdown.Markdown(extensions=['meta'], cache_dir='.markdown-cache')
+    md.convertFile('index.md', 'index.html')
+
+With the `cache_dir` option, `Markdown.convertFile` looks up the html and
+the `Meta` of the source in the cache before converting it (see
+`Cache.convert`). An entry is found by a digest of the source text, of the
+options and extensions of the instance and of the version of markdown, so
+any change to one of those converts the source anew.
+
+Each entry is a file of its own, written to a temporary file first and
+renamed, so that processes converting at once, as in batch mode, never
+read half an entry. When the entries take more than `cache_size` bytes the
+least recently used are removed.
+
+"""
+
+import os
+import hashlib
+import logging
+import markdown
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+logger = logging.getLogger('MARKDOWN')
+
+# Default bound of the size of a cache directory, in bytes
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+# Suffix of the entry files
+ENTRY_SUFFIX = '.json'
+
+
+def fingerprint(extensions=(), extension_configs={}):
+    """ Return a digest of the extensions given to a Markdown instance. """
+    names = []
+    for ext in extensions:
+        if isinstance(ext, basestring):
+            names.append(ext)
+        else:
+            names.append('%s.%s%r' % (ext.__class__.__module__,
+                                      ext.__class__.__name__,
+                                      sorted(ext.getConfigs().items())))
+    items = [names, sorted(dict(extension_configs).items())]
+    return hashlib.md5(repr(items)).hexdigest()
+
+
+class Cache:
+    """ A directory of converted documents, bounded in size. """
+
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE, extensions=''):
+        self.path = path
+        self.max_size = max_size
+        # The fingerprint of the extensions of the instance
+        self.extensions = extensions
+        # The size of the entries, counted when first needed
+        self.size = None
+
+    def key(self, md, text):
+        """ Return the key of the html of `text` converted by `md`. """
+        options = [(name, getattr(md, name)) for name in
+                   sorted(md.option_defaults)]
+        options += [('safe_mode', md.safeMode),
+                    ('output_format', md.output_format),
+                    ('extensions', self.extensions),
+                    ('version', markdown.version)]
+        digest = hashlib.sha1(text.encode('utf-8'))
+        digest.update(repr(options))
+        return digest.hexdigest()
+
+    def convert(self, md, text):
+        """
+        Return the html of `text` converted by `md`, from the cache if it
+        holds it. `Meta` and `raw_html_found` are set as `convert` sets them.
+
+        """
+        key = self.key(md, text)
+        entry = self.get(key)
+        if entry is not None:
+            md._reset_context()
+            md.raw_html_found = entry['raw_html_found']
+            if entry['meta'] is not None:
+                md.Meta = entry['meta']
+            return entry['html']
+        html = md.convert(text)
+        self.set(key, {'html': html,
+                       'meta': getattr(md.context, 'Meta', None),
+                       'raw_html_found': getattr(md.context, 'raw_html_found',
+                                                 False)})
+        return html
+
+    def get(self, key):
+        """ Return the entry stored under `key`, or None. """
+        path = self._path(key)
+        try:
+            f = open(path, 'rb')
+            try:
+                entry = json.load(f)
+            finally:
+                f.close()
+        except (IOError, OSError):
+            return None
+        except ValueError:
+            logger.warn('Ignoring corrupt cache entry %s' % path)
+            return None
+        try:
+            # Mark the entry as recently used.
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry
+
+    def set(self, key, entry):
+        """ Store `entry` under `key`, replacing the file atomically. """
+        _makedirs(self.path)
+        path = self._path(key)
+        data = json.dumps(entry)
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        f = open(tmp, 'wb')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+        os.rename(tmp, path)
+        if self.size is None:
+            self.size = sum([size for size, mtime, path in self._entries()])
+        else:
+            self.size += len(data)
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache takes no
+        more than nine tenths of `max_size`, so that it is not scanned
+        again on every write.
+
+        """
+        entries = self._entries()
+        self.size = sum([size for size, mtime, path in entries])
+        entries.sort(key=lambda entry: entry[1])
+        limit = self.max_size * 9 // 10
+        for size, mtime, path in entries:
+            if self.size <= limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Another process may have removed it already.
+                pass
+            self.size -= size
+
+    def clear(self):
+        """ Remove all entries. """
+        for size, mtime, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.size = 0
+
+    def _entries(self):
+        """ Return a list of the (size, mtime, path) of the entries. """
+        entries = []
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return entries
+        for name in names:
+            if name.endswith(ENTRY_SUFFIX):
+                path = os.path.join(self.path, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_size, stat.st_mtime, path))
+        return entries
+
+    def _path(self, key):
+        return os.path.join(self.path, key + ENTRY_SUFFIX)
+
+
+def _makedirs(path):
+    """ Create directory `path` unless it already exists. """
+    if path and not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            # Another process may have just created it.
+            if not os.path.isdir(path):
+                raise
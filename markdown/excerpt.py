@@ -0,0 +1,233 @@
+"""
+EXCERPTS
+=============================================================================
+
+Convert only the start of a long document, for listings and link previews.
+
+    md = markdown.Markdown()
+    html = md.convert(text, max_blocks=2)
+
+`Markdown.convert` cuts the source with `head` before preprocessing it, so
+the work done does not grow with the length of the document. The head is
+cut where `streaming.Chunker` may cut a chunk, after more blocks and text
+than the excerpt is expected to need, and cut longer if the block parser
+does not get past the excerpt in it (see `BlockParser.parseDocument`).
+
+The last block of an excerpt is converted whole, as in the full document.
+Blocks after it may still add to it, so the parser reads on until the next
+block starts. A list item followed by an indented paragraph becomes loose:
+
+    >>> import markdown
+    >>> md = markdown.Markdown()
+    >>> print md.convert(u'* a\\n* f\\n\\n    more\\n\\nafter', max_blocks=1)
+    <ul>
+    <li>a</li>
+    <li>
+    <p>f</p>
+    <p>more</p>
+    </li>
+    </ul>
+
+And a code block goes on after a blank line:
+
+    >>> print md.convert(u'Some text.\\n\\n    code\\n\\n    more\\n\\nafter',
+    ...                  max_chars=12)
+    <p>Some text.</p>
+    <pre><code>code
+    <BLANKLINE>
+    more
+    </code></pre>
+
+What the head refers to but the rest of the document defines is found by
+a pre-scan of the rest, which looks only at lines starting with ``[`` or
+``*[``: reference definitions, the definitions of the footnotes referred
+to in the head, and abbreviations. They are added to the end of the head,
+where their preprocessors remove them as usual. Lines inside fenced code
+and raw html blocks define nothing, as in the full document:
+
+    >>> source = u'See [a] here\\n\\n' + u'para\\n\\n' * 50 + \\
+    ...     u'~~~\\n[a]: http://example.com\\n~~~\\n'
+    >>> md = markdown.Markdown(extensions=['fenced_code'])
+    >>> print md.convert(source, max_blocks=1)
+    <p>See [a] here</p>
+
+"""
+
+import re
+import util
+from streaming import Chunker, FENCE_RE
+from preprocessors import ReferencePreprocessor
+
+# A line which may start a definition, or start or end a fenced code block
+# or a raw html block
+LINE_RE = re.compile(r'^(?:[ ]{0,3}\[|\*\[|~{3}|`{3}|<).*$|^.*(?:</|-->).*$',
+                     re.MULTILINE)
+DEFINITION_RE = re.compile(r'[ ]{0,3}\[|\*\[')
+# The start of a raw html block
+HTML_RE = re.compile(r'<(!--|[^> /]+)')
+# A footnote definition and an abbreviation (see the extensions)
+FOOTNOTE_RE = re.compile(r'[ ]{0,3}\[\^([^\]]*)\]:\s*(.*)')
+ABBR_RE = re.compile(r'[*]\[(?P<abbr>[^\]]*)\][ ]?:\s*(?P<title>.*)')
+INDENT_RE = re.compile(r'^(\t|    )')
+
+
+def parse(md, source, max_blocks=None, max_chars=None):
+    """
+    Preprocess and parse an excerpt of `source` with the Markdown instance
+    `md` and return the root element.
+
+    The head of the source is cut for a budget twice the excerpt's. If the
+    parser does not reach the block after the excerpt in the head, which
+    markup, raw html or a long last block can cause, the head is cut anew
+    for twice as much and parsed again.
+
+    """
+    scale = 2
+    while 1:
+        text, whole = head(md, source, max_blocks, max_chars, scale)
+        root = md._parse(text, max_blocks, max_chars)
+        if whole or md.context.excerpt_cut:
+            return root
+        md._reset_context()
+        scale *= 2
+
+
+def head(md, source, max_blocks=None, max_chars=None, scale=2):
+    """
+    Return the start of `source` which an excerpt of at most `max_blocks`
+    blocks or `max_chars` characters of text is expected to need, with the
+    definitions the rest of `source` holds for it. `scale` times as many
+    blocks and characters are kept.
+
+    Returns the text and whether it is the whole of `source`.
+
+    """
+    source = source.replace("\r\n", "\n").replace("\r", "\n")
+    end = _find_end(source, max_blocks, max_chars, scale)
+    if end is None:
+        return source, True
+    text = source[:end]
+    definitions = _definitions(md, source, end, text)
+    if definitions:
+        # A blank line after each, so that none runs on into the next
+        text = u'%s\n\n%s\n' % (text, u'\n\n'.join(definitions))
+    return text, False
+
+
+def _find_end(source, max_blocks, max_chars, scale):
+    """ Return where to cut `source` for the excerpt, or None if whole. """
+    chunker = Chunker()
+    blocks = 0
+    chars = 0
+    pos = 0
+    while pos < len(source):
+        line = _line(source, pos)
+        size = len(line)
+        if not line.strip():
+            line = ''
+        if chunker.can_cut(line):
+            blocks += 1
+            if max_blocks is not None and blocks > scale * max_blocks or \
+                    max_chars is not None and chars > scale * max_chars:
+                return pos
+        chars += len(line)
+        pos += size + 1
+    return None
+
+
+def _definitions(md, source, end, text):
+    """
+    Return the text of each definition after `end` in `source` which the
+    preprocessors of `md` would take out of the document. Lines in fenced
+    code blocks and raw html blocks are skipped, as those preprocessors
+    take them out first.
+
+    """
+    definitions = []
+    fenced = 'fenced_code_block' in md.preprocessors
+    fence = None
+    html = None
+    for m in LINE_RE.finditer(source, end):
+        line = m.group()
+        if fence is not None:
+            if line.rstrip(' ') == fence:
+                fence = None
+            continue
+        if html is not None:
+            if html in line:
+                html = None
+            continue
+        start = FENCE_RE.match(line)
+        if fenced and start:
+            fence = start.group(1)
+            continue
+        start = HTML_RE.match(line)
+        if start and (m.start() == end or
+                      source.startswith('\n\n', m.start() - 2)):
+            close = _closing_tag(start.group(1))
+            if close is not None:
+                if close not in line[start.end():]:
+                    html = close
+                continue
+        if not DEFINITION_RE.match(line):
+            continue
+        footnote = FOOTNOTE_RE.match(line)
+        if footnote and 'footnote' in md.preprocessors:
+            # The footnotes extension takes these before the references.
+            if u'[^%s]' % footnote.group(1) in text:
+                definitions.append(_footnote(source, m.start()))
+        elif ReferencePreprocessor.RE.match(line):
+            # The title may be on the next line.
+            next = _line(source, m.end() + 1)
+            if ReferencePreprocessor.TITLE_RE.match(next):
+                line = u'%s\n%s' % (line, next)
+            definitions.append(line)
+        elif 'abbr' in md.preprocessors and ABBR_RE.match(line):
+            definitions.append(line)
+    return definitions
+
+
+def _closing_tag(tag):
+    """
+    Return what ends a raw html block started by `tag`, or None if the tag
+    does not start one.
+
+    """
+    if tag == '!--':
+        return '-->'
+    tag = tag.lower()
+    if util.isBlockLevel(tag) and tag != 'hr':
+        return '</%s>' % tag
+    return None
+
+
+def _footnote(source, start):
+    """
+    Return the text of the footnote defined at `start` in `source`: its
+    first paragraph and the indented lines after it, as the footnotes
+    extension takes them.
+
+    """
+    lines = []
+    blank = False
+    pos = start
+    while pos < len(source):
+        line = _line(source, pos)
+        if not line.strip():
+            blank = True
+        elif lines and not INDENT_RE.match(line) and \
+                (blank or FOOTNOTE_RE.match(line)):
+            break
+        lines.append(line)
+        pos += len(line) + 1
+    while lines and not lines[-1].strip():
+        lines.pop()
+    return u'\n'.join(lines)
+
+
+def _line(source, pos):
+    """ Return the line of `source` which starts at `pos`. """
+    end = source.find('\n', pos)
+    if end < 0:
+        end = len(source)
+    return source[pos:end]
@@ -44,7 +44,8 @@ class AbbrPreprocessor(markdown.preprocessors.Preprocessor):
     def run(self, lines):
         '''
         Find and remove all Abbreviation references from the text.
-        Each reference is set as a new AbbrPattern in the markdown instance.
+        Each reference is set as a new AbbrPattern in the inline patterns
+        of the document, which the RenderContext keeps.
         
         '''
         new_text = []
@@ -53,8 +54,12 @@ class AbbrPreprocessor(markdown.preprocessors.Preprocessor):
             if m:
                 abbr = m.group('abbr').strip()
                 title = m.group('title').strip()
-                self.markdown.inlinePatterns['abbr-%s'%abbr] = \
-                    AbbrPattern(self._generate_pattern(abbr), title)
+                pattern = AbbrPattern(self._generate_pattern(abbr), title)
+                pattern.triggers = abbr[0]
+                context = self.markdown.context
+                if context.inlinePatterns is None:
+                    context.inlinePatterns = self.markdown.inlinePatterns.copy()
+                context.inlinePatterns['abbr-%s'%abbr] = pattern
             else:
                 new_text.append(line)
         return new_text
@@ -21,6 +21,10 @@ Dependencies:
 """
 
 import markdown
+import atexit
+import hashlib
+import re
+import threading
 try:
     from pygments import highlight
     from pygments.lexers import get_lexer_by_name, guess_lexer, TextLexer
@@ -28,6 +32,222 @@ try:
     pygments = True
 except ImportError:
     pygments = False
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+# ------------------ The Highlight Cache ----------------------------------
+class HiliteCache:
+    """
+    A bounded, least-recently-used store of highlighted html.
+
+    Highlighting the same snippet with the same options always gives the same
+    html, so the result is kept here and shared by every Markdown instance in
+    the process. Once `maxsize` entries are stored, the entry used least
+    recently is dropped.
+
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._store = markdown.odict.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Return the html stored for `key` or None. """
+        self._lock.acquire()
+        try:
+            if key not in self._store:
+                return None
+            # Move the entry to the end so it is evicted last.
+            html = self._store.pop(key)
+            self._store[key] = html
+            return html
+        finally:
+            self._lock.release()
+
+    def set(self, key, html):
+        """ Store `html` for `key`, evicting the oldest entry if full. """
+        self._lock.acquire()
+        try:
+            if key in self._store:
+                self._store.pop(key)
+            elif len(self._store) >= self.maxsize:
+                self._store.pop(self._store.keyOrder[0])
+            self._store[key] = html
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """ Remove all entries. """
+        self._lock.acquire()
+        try:
+            self._store = markdown.odict.OrderedDict()
+        finally:
+            self._lock.release()
+
+# The cache shared by the codehilite and fenced_code extensions.
+hilite_cache = HiliteCache()
+
+
+# ------------------ Language Detection -----------------------------------
+# Only this many characters from the start of a block are examined.
+GUESS_SAMPLE_SIZE = 4096
+# The best language must score at least this much ...
+GUESS_MIN_SCORE = 4
+# ... and at least this many times more than the runner-up.
+GUESS_MIN_RATIO = 2
+
+GUESS_SHEBANG_RE = re.compile(r'^#!(?:\S*/)?(?:env\s+)?(?P<interp>[a-z]+)')
+GUESS_WORD_RE = re.compile(r'[A-Za-z_$#][\w$]*')
+GUESS_TAG_RE = re.compile(r'</?[a-zA-Z][\w:-]*(\s[^>]*)?/?>')
+GUESS_CSS_RULE_RE = re.compile(r'^\s*[\w-]+\s*:\s*[^;{}]+;\s*$')
+
+GUESS_INTERPRETERS = {'python': 'python', 'ruby': 'ruby', 'perl': 'perl',
+                      'php': 'php', 'node': 'javascript', 'sh': 'bash',
+                      'bash': 'bash', 'zsh': 'bash'}
+
+# Keywords which point at a language, by weight. Distinctive keywords weigh
+# more than those shared with related languages.
+GUESS_KEYWORDS = {
+    'python': ('def:2 elif:3 self:2 None:3 True:1 False:1 lambda:2 '
+               'import:1 from:1 pass:2 yield:1 except:2 __init__:3 print:1'),
+    'ruby': ('def:1 end:2 elsif:3 puts:3 nil:3 unless:2 require:2 do:1 '
+             'attr_accessor:3 module:1'),
+    'javascript': ('function:2 var:2 let:1 const:1 undefined:3 null:1 '
+                   'console:3 document:3 window:3 typeof:2 this:1'),
+    'java': ('public:2 private:1 static:1 void:1 extends:2 implements:3 '
+             'System:3 String:2 package:2 import:1 final:2 new:1'),
+    'c': ('#include:3 #define:3 int:1 char:1 void:1 struct:2 unsigned:2 '
+          'sizeof:2 printf:3 malloc:3 NULL:2 typedef:2'),
+    'cpp': ('#include:2 std:3 cout:3 template:3 namespace:3 virtual:2 '
+            'class:1 public:1 nullptr:3'),
+    'php': '$this:3 echo:2 function:1 foreach:2 array:2',
+    'sql': ('SELECT:3 FROM:2 WHERE:2 INSERT:3 UPDATE:2 JOIN:3 CREATE:2 '
+            'TABLE:2 VALUES:2 ORDER:1 GROUP:1'),
+    'bash': 'echo:1 fi:3 then:2 esac:3 done:2 export:2 elif:1',
+    }
+
+def _build_keyword_table(keywords):
+    """ Map each keyword to a list of (language, weight) tuples. """
+    table = {}
+    for lang, words in keywords.items():
+        for item in words.split():
+            word, weight = item.rsplit(':', 1)
+            table.setdefault(word, []).append((lang, int(weight)))
+    return table
+
+GUESS_KEYWORD_TABLE = _build_keyword_table(GUESS_KEYWORDS)
+
+class GuessStats:
+    """
+    Count how often the language of a block was found by `guess_language`
+    and how often pygments' `guess_lexer` was needed. The counts of all
+    Markdown instances of the process are kept together.
+
+    A language found by the heuristic highlights a block as if it had
+    been given (this needs pygments):
+
+        >>> guess_stats.reset()
+        >>> src = 'def area(self):\\n    return self.w * self.h'
+        >>> CodeHilite(src).hilite() == CodeHilite(src, lang='python').hilite()
+        True
+        >>> html = CodeHilite('some words').hilite()
+        >>> sorted(guess_stats.counts().items())
+        [('heuristic', 1), ('pygments', 1)]
+
+    """
+
+    def __init__(self):
+        self._counts = {'heuristic': 0, 'pygments': 0}
+        self._lock = threading.Lock()
+
+    def add(self, way):
+        """ Count a guess made by `way`, 'heuristic' or 'pygments'. """
+        self._lock.acquire()
+        try:
+            self._counts[way] += 1
+        finally:
+            self._lock.release()
+
+    def counts(self):
+        """ Return a dict of the number of guesses made by each way. """
+        self._lock.acquire()
+        try:
+            return dict(self._counts)
+        finally:
+            self._lock.release()
+
+    def reset(self):
+        """ Set all counts to zero. """
+        self._lock.acquire()
+        try:
+            for way in self._counts:
+                self._counts[way] = 0
+        finally:
+            self._lock.release()
+
+# How often each way of guessing a language was taken.
+guess_stats = GuessStats()
+
+def guess_language(src):
+    """
+    Return the name of the language of `src` or None if unsure.
+
+    A cheap alternative to pygments' `guess_lexer`, which runs every lexer
+    over the whole source. Only the first GUESS_SAMPLE_SIZE characters are
+    looked at. A shebang or an xml/php opening tag decides at once. Otherwise
+    each language is scored by the keywords found in the sample and by the
+    shape of its lines (trailing colons, trailing semicolons, css rules and
+    html tags). None is returned if the best score is low or not clearly
+    ahead of the runner-up.
+
+        >>> guess_language('#!/usr/bin/env ruby\\nputs 1')
+        'ruby'
+        >>> guess_language('def area(self):\\n    return self.w * self.h')
+        'python'
+        >>> print guess_language('some words')
+        None
+
+    """
+    sample = src[:GUESS_SAMPLE_SIZE]
+    start = sample.lstrip()
+    m = GUESS_SHEBANG_RE.match(start)
+    if m and m.group('interp') in GUESS_INTERPRETERS:
+        return GUESS_INTERPRETERS[m.group('interp')]
+    if start.startswith('<?php'):
+        return 'php'
+    if start.startswith('<?xml'):
+        return 'xml'
+
+    scores = {}
+    def score(lang, points):
+        scores[lang] = scores.get(lang, 0) + points
+
+    for word in GUESS_WORD_RE.findall(sample):
+        for lang, weight in GUESS_KEYWORD_TABLE.get(word, ()):
+            score(lang, weight)
+    for line in sample.split('\n'):
+        line = line.rstrip()
+        if line.endswith(':'):
+            score('python', 1)
+        elif line.endswith(';'):
+            if GUESS_CSS_RULE_RE.match(line):
+                score('css', 2)
+            for lang in ('c', 'cpp', 'java', 'javascript', 'php'):
+                score(lang, 1)
+    tags = len(GUESS_TAG_RE.findall(sample))
+    if tags:
+        score('html', tags)
+
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    if not ranked or ranked[0][1] < GUESS_MIN_SCORE:
+        return None
+    if len(ranked) > 1 and ranked[0][1] < GUESS_MIN_RATIO * ranked[1][1]:
+        return None
+    return ranked[0][0]
+
 
 # ------------------ The Main CodeHilite Class ----------------------
 class CodeHilite:
@@ -46,6 +266,8 @@ class CodeHilite:
 
     * css_class: Set class name of wrapper div ('codehilite' by default).
 
+    * cache: A HiliteCache to look up and store the html in (None by default).
+
     Low Level Usage:
         >>> code = CodeHilite()
         >>> code.src = 'some text' # String or anything with a .readline attr.
@@ -56,7 +278,7 @@ class CodeHilite:
 
     def __init__(self, src=None, linenos=False, guess_lang=True,
                 css_class="codehilite", lang=None, style='default',
-                noclasses=False, tab_length=4):
+                noclasses=False, tab_length=4, cache=None):
         self.src = src
         self.lang = lang
         self.linenos = linenos
@@ -65,6 +287,9 @@ class CodeHilite:
         self.style = style
         self.noclasses = noclasses
         self.tab_length = tab_length
+        self.cache = cache
+        # How the lexer was guessed by the last `_hilite`, if it was
+        self.guessed = None
 
     def hilite(self):
         """
@@ -77,7 +302,35 @@ class CodeHilite:
 
         """
 
+        if self.cache is not None:
+            key = self._cache_key()
+            html = self.cache.get(key)
+            if html is None:
+                html = self._counted_hilite()
+                self.cache.set(key, html)
+            return html
+        return self._counted_hilite()
+
+    def _counted_hilite(self):
+        """ Highlight the source and count how its lexer was guessed. """
+        html = self._hilite()
+        if self.guessed is not None:
+            guess_stats.add(self.guessed)
+        return html
+
+    def _cache_key(self):
+        """ Return a key identifying the source and all output options. """
+        src = self.src
+        if isinstance(src, unicode):
+            src = src.encode('utf-8')
+        return (self.lang, self.linenos, self.guess_lang, self.css_class,
+                self.style, self.noclasses, hashlib.md5(src).hexdigest())
+
+    def _hilite(self):
+        """ Highlight the source without consulting the cache. """
+
         self.src = self.src.strip('\n')
+        self.guessed = None
 
         if self.lang is None:
             self._getLang()
@@ -88,7 +341,7 @@ class CodeHilite:
             except ValueError:
                 try:
                     if self.guess_lang:
-                        lexer = guess_lexer(self.src)
+                        lexer = self._guess_lexer()
                     else:
                         lexer = TextLexer()
                 except ValueError:
@@ -115,6 +368,23 @@ class CodeHilite:
             return '<pre class="%s"><code%s>%s</code></pre>\n'% \
                         (self.css_class, class_str, txt)
 
+    def _guess_lexer(self):
+        """
+        Return a lexer for source of unknown language. The cheap guess_language
+        is tried first and pygments' guess_lexer is only used if it is unsure.
+
+        """
+        lang = guess_language(self.src)
+        if lang is not None:
+            try:
+                lexer = get_lexer_by_name(lang)
+                self.guessed = 'heuristic'
+                return lexer
+            except ValueError:
+                pass
+        self.guessed = 'pygments'
+        return guess_lexer(self.src)
+
     def _getLang(self):
         """
         Determines language of a code block from shebang line and whether said
@@ -164,31 +434,137 @@ class CodeHilite:
 
 
 
+# ------------------ Highlighting Many Blocks ----------------------------
+# The pools are kept for the life of the process, as starting one costs
+# more than highlighting most documents, and closed on exit.
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _get_pool(workers):
+    """ Return a process pool of `workers` processes or None if unavailable. """
+    if workers < 2 or multiprocessing is None:
+        return None
+    _pools_lock.acquire()
+    try:
+        if workers not in _pools:
+            try:
+                _pools[workers] = multiprocessing.Pool(workers)
+            except (OSError, NotImplementedError):
+                # No subprocesses on this platform (i.e.: App Engine).
+                _pools[workers] = None
+        return _pools[workers]
+    finally:
+        _pools_lock.release()
+
+def close_pools():
+    """
+    Stop the worker processes of the pools. A pool is started anew when a
+    document is highlighted with workers again.
+
+    """
+    _pools_lock.acquire()
+    try:
+        pools = _pools.values()
+        _pools.clear()
+    finally:
+        _pools_lock.release()
+    for pool in pools:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+atexit.register(close_pools)
+
+def _hilite_worker(args):
+    """
+    Highlight one block in a pool process. `args` are CodeHilite args.
+    Returns the html and how the lexer was guessed, which is counted in
+    the calling process.
+
+    """
+    code = CodeHilite(*args)
+    html = code._hilite()
+    return html, code.guessed
+
+def hilite_all(hiliters, workers=0):
+    """
+    Highlight a list of CodeHilite instances and return a list of html.
+
+    Blocks found in the cache are not highlighted again. When `workers` is 2
+    or more and more than one block is left, the remaining blocks are
+    highlighted concurrently in a pool of that many processes. Pygments is
+    pure Python, so processes rather than threads are used. Without a pool,
+    the blocks are highlighted one after another.
+
+    """
+    results = [None] * len(hiliters)
+    pending = []
+    for i, code in enumerate(hiliters):
+        key = None
+        if code.cache is not None:
+            key = code._cache_key()
+            results[i] = code.cache.get(key)
+        if results[i] is None:
+            pending.append((i, key))
+
+    pool = None
+    if len(pending) > 1:
+        pool = _get_pool(workers)
+    if pool is not None:
+        args = [(c.src, c.linenos, c.guess_lang, c.css_class, c.lang, c.style,
+                 c.noclasses, c.tab_length)
+                for c in [hiliters[i] for i, key in pending]]
+        htmls = []
+        for html, guessed in pool.map(_hilite_worker, args):
+            if guessed is not None:
+                guess_stats.add(guessed)
+            htmls.append(html)
+    else:
+        htmls = [hiliters[i]._counted_hilite() for i, key in pending]
+
+    for (i, key), html in zip(pending, htmls):
+        results[i] = html
+        if key is not None:
+            hiliters[i].cache.set(key, html)
+    return results
+
+
 # ------------------ The Markdown Extension -------------------------------
 class HiliteTreeprocessor(markdown.treeprocessors.Treeprocessor):
     """ Hilight source code in code blocks. """
 
     def run(self, root):
         """ Find code blocks and store in htmlStash. """
-        blocks = root.getiterator('pre')
-        for block in blocks:
+        blocks = []
+        hiliters = []
+        for block in root.getiterator('pre'):
             children = block.getchildren()
             if len(children) == 1 and children[0].tag == 'code':
-                code = CodeHilite(children[0].text,
+                blocks.append(block)
+                hiliters.append(CodeHilite(children[0].text,
                             linenos=self.config['force_linenos'],
                             guess_lang=self.config['guess_lang'],
                             css_class=self.config['css_class'],
                             style=self.config['pygments_style'],
                             noclasses=self.config['noclasses'],
-                            tab_length=self.markdown.tab_length)
-                placeholder = self.markdown.htmlStash.store(code.hilite(),
-                                                            safe=True)
-                # Clear codeblock in etree instance
-                block.clear()
-                # Change to p element which will later
-                # be removed when inserting raw html
-                block.tag = 'p'
-                block.text = placeholder
+                            tab_length=self.markdown.tab_length,
+                            cache=self._get_cache()))
+        # Highlight all blocks at once so they can be spread over a pool.
+        htmls = hilite_all(hiliters, int(self.config['workers']))
+        for block, html in zip(blocks, htmls):
+            placeholder = self.markdown.htmlStash.store(html, safe=True)
+            # Clear codeblock in etree instance
+            block.clear()
+            # Change to p element which will later
+            # be removed when inserting raw html
+            block.tag = 'p'
+            block.text = placeholder
+
+    def _get_cache(self):
+        """ Return the shared cache, or None if caching is turned off. """
+        if self.config['use_cache']:
+            return hilite_cache
+        return None
 
 
 class CodeHiliteExtension(markdown.Extension):
@@ -202,7 +578,9 @@ class CodeHiliteExtension(markdown.Extension):
             'css_class' : ["codehilite",
                            "Set class name for wrapper <div> - Default: codehilite"],
             'pygments_style' : ['default', 'Pygments HTML Formatter Style (Colorscheme) - Default: default'],
-            'noclasses': [False, 'Use inline styles instead of CSS classes - Default false']
+            'noclasses': [False, 'Use inline styles instead of CSS classes - Default false'],
+            'use_cache': [True, 'Reuse html of previously highlighted code - Default: True'],
+            'workers': [0, 'Highlight code blocks in a pool of this many processes - Default: 0 (off)']
             }
 
         # Override defaults with user settings
@@ -224,3 +602,7 @@ class CodeHiliteExtension(markdown.Extension):
 def makeExtension(configs={}):
   return CodeHiliteExtension(configs=configs)
 
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -51,7 +51,7 @@ class DefListProcessor(markdown.blockprocessors.BlockProcessor):
         if not terms and sibling.tag == 'p':
             # The previous paragraph contains the terms
             state = 'looselist'
-            terms = sibling.text.split('\n')
+            terms = self.parser.getText(sibling).split('\n')
             parent.remove(sibling)
             # Aquire new sibling
             sibling = self.lastChild(parent)
@@ -77,7 +77,8 @@ Dependencies:
 
 import re
 import markdown
-from markdown.extensions.codehilite import CodeHilite, CodeHiliteExtension
+from markdown.extensions.codehilite import CodeHilite, CodeHiliteExtension, \
+                                           hilite_cache, hilite_all
 
 # Global vars
 FENCED_BLOCK_RE = re.compile( \
@@ -119,6 +120,8 @@ class FencedBlockPreprocessor(markdown.preprocessors.Preprocessor):
             self.checked_for_codehilite = True
 
         text = "\n".join(lines)
+        # Stash indexes and CodeHilite instances of blocks still to highlight
+        pending = []
         while 1:
             m = FENCED_BLOCK_RE.search(text)
             if m:
@@ -129,15 +132,23 @@ class FencedBlockPreprocessor(markdown.preprocessors.Preprocessor):
                 # If config is not empty, then the codehighlite extension
                 # is enabled, so we call it to highlite the code
                 if self.codehilite_conf:
+                    cache = None
+                    if self.codehilite_conf['use_cache'][0]:
+                        cache = hilite_cache
                     highliter = CodeHilite(m.group('code'),
                             linenos=self.codehilite_conf['force_linenos'][0],
                             guess_lang=self.codehilite_conf['guess_lang'][0],
                             css_class=self.codehilite_conf['css_class'][0],
                             style=self.codehilite_conf['pygments_style'][0],
                             lang=(m.group('lang') or None),
-                            noclasses=self.codehilite_conf['noclasses'][0])
-
-                    code = highliter.hilite()
+                            noclasses=self.codehilite_conf['noclasses'][0],
+                            cache=cache)
+
+                    # Reserve a place in the stash. The html is filled in
+                    # once all blocks in the document have been highlighted.
+                    pending.append((self.markdown.htmlStash.html_counter,
+                                    highliter))
+                    code = ''
                 else:
                     code = CODE_WRAP % (lang, self._escape(m.group('code')))
 
@@ -145,6 +156,12 @@ class FencedBlockPreprocessor(markdown.preprocessors.Preprocessor):
                 text = '%s\n%s\n%s'% (text[:m.start()], placeholder, text[m.end():])
             else:
                 break
+
+        if pending:
+            htmls = hilite_all([h for i, h in pending],
+                               int(self.codehilite_conf['workers'][0]))
+            for (i, h), code in zip(pending, htmls):
+                self.markdown.htmlStash.fill(i, code, safe=True)
         return text.split("\n")
 
     def _escape(self, txt):
@@ -24,11 +24,16 @@ Example:
 """
 
 import re
+import itertools
 import markdown
 from markdown.util import etree
 
 FN_BACKLINK_TEXT = "zz1337820767766393qq"
 NBSP_PLACEHOLDER =  "qq3936677670287331zz"
+# The value of the rel and rev attributes, which are invalid in HTML5 and
+# so only set once the output format is known
+FN_REL_PLACEHOLDER = "zz4180238763451920qq"
+FN_REL_RE = re.compile(r' (?:rel|rev)=(["\']?)%s\1' % FN_REL_PLACEHOLDER)
 DEF_RE = re.compile(r'[ ]{0,3}\[\^([^\]]*)\]:\s*(.*)')
 TABBED_RE = re.compile(r'((\t)|(    ))(.*)')
 
@@ -53,9 +58,7 @@ class FootnoteExtension(markdown.Extension):
             self.config[key][0] = value
 
         # In multiple invocations, emit links that don't get tangled.
-        self.unique_prefix = 0
-
-        self.reset()
+        self.unique_prefixes = itertools.count(1)
 
     def extendMarkdown(self, md, md_globals):
         """ Add pieces to Markdown. """
@@ -80,8 +83,15 @@ class FootnoteExtension(markdown.Extension):
 
     def reset(self):
         """ Clear the footnotes on reset, and prepare for a distinct document. """
-        self.footnotes = markdown.odict.OrderedDict()
-        self.unique_prefix += 1
+        context = self.md.context
+        context.footnotes = markdown.odict.OrderedDict()
+        context.footnote_prefix = self.unique_prefixes.next()
+
+    def _get_footnotes(self):
+        return self.md.context.footnotes
+
+    # The footnotes of the current document, kept in its RenderContext
+    footnotes = property(_get_footnotes)
 
     def findFootnotesPlaceholder(self, root):
         """ Return ElementTree Element that contains Footnote placeholder. """
@@ -106,14 +116,14 @@ class FootnoteExtension(markdown.Extension):
     def makeFootnoteId(self, id):
         """ Return footnote link id. """
         if self.getConfig("UNIQUE_IDS"):
-            return 'fn:%d-%s' % (self.unique_prefix, id)
+            return 'fn:%d-%s' % (self.md.context.footnote_prefix, id)
         else:
             return 'fn:%s' % id
 
     def makeFootnoteRefId(self, id):
         """ Return footnote back-link id. """
         if self.getConfig("UNIQUE_IDS"):
-            return 'fnref:%d-%s' % (self.unique_prefix, id)
+            return 'fnref:%d-%s' % (self.md.context.footnote_prefix, id)
         else:
             return 'fnref:%s' % id
 
@@ -134,8 +144,7 @@ class FootnoteExtension(markdown.Extension):
             self.parser.parseChunk(li, self.footnotes[id])
             backlink = etree.Element("a")
             backlink.set("href", "#" + self.makeFootnoteRefId(id))
-            if self.md.output_format not in ['html5', 'xhtml5']:
-                backlink.set("rev", "footnote") # Invalid in HTML5
+            backlink.set("rev", FN_REL_PLACEHOLDER)
             backlink.set("class", "footnote-backref")
             backlink.set("title", "Jump back to footnote %d in the text" % \
                             (self.footnotes.index(id)+1))
@@ -247,6 +256,8 @@ class FootnotePreprocessor(markdown.preprocessors.Preprocessor):
 class FootnotePattern(markdown.inlinepatterns.Pattern):
     """ InlinePattern for footnote markers in a document's body text. """
 
+    triggers = '['
+
     def __init__(self, pattern, footnotes):
         markdown.inlinepatterns.Pattern.__init__(self, pattern)
         self.footnotes = footnotes
@@ -258,8 +269,7 @@ class FootnotePattern(markdown.inlinepatterns.Pattern):
             a = etree.SubElement(sup, "a")
             sup.set('id', self.footnotes.makeFootnoteRefId(id))
             a.set('href', '#' + self.footnotes.makeFootnoteId(id))
-            if self.footnotes.md.output_format not in ['html5', 'xhtml5']:
-                a.set('rel', 'footnote') # invalid in HTML5
+            a.set('rel', FN_REL_PLACEHOLDER)
             a.set('class', 'footnote-ref')
             a.text = unicode(self.footnotes.footnotes.index(id) + 1)
             return sup
@@ -296,8 +306,18 @@ class FootnotePostprocessor(markdown.postprocessors.Postprocessor):
 
     def run(self, text):
         text = text.replace(FN_BACKLINK_TEXT, self.footnotes.getConfig("BACKLINK_TEXT"))
+        md = self.footnotes.md
+        if (md.context.output_format or md.output_format) in ['html5', 'xhtml5']:
+            text = FN_REL_RE.sub('', text) # Invalid in HTML5
+        else:
+            text = text.replace(FN_REL_PLACEHOLDER, "footnote")
         return text.replace(NBSP_PLACEHOLDER, "&#160;")
 
+    def run_text(self, text):
+        """ Leave the backlinks out of the plain text. """
+        text = text.replace(FN_BACKLINK_TEXT, "")
+        return text.replace(NBSP_PLACEHOLDER, "")
+
 def makeExtension(configs=[]):
     """ Return an instance of the FootnoteExtension """
     return FootnoteExtension(configs=configs)
@@ -125,8 +125,6 @@ def itertext(elem):
 class HeaderIdTreeprocessor(markdown.treeprocessors.Treeprocessor):
     """ Assign IDs to headers. """
 
-    IDs = set()
-
     def run(self, doc):
         start_level, force_id = self._get_meta()
         slugify = self.config['slugify']
@@ -138,7 +136,7 @@ class HeaderIdTreeprocessor(markdown.treeprocessors.Treeprocessor):
                         id = elem.id
                     else:
                         id = slugify(u''.join(itertext(elem)), sep)
-                    elem.set('id', unique(id, self.IDs))
+                    elem.set('id', unique(id, self.md.context.header_ids))
                 if start_level:
                     level = int(elem.tag[-1]) + start_level
                     if level > 6:
@@ -189,7 +187,8 @@ class HeaderIdExtension (markdown.Extension):
         md.treeprocessors.add('headerid', self.processor, '>inline')
 
     def reset(self):
-        self.processor.IDs = []
+        # The ids of the current document, kept in its RenderContext
+        self.processor.md.context.header_ids = []
 
 
 def makeExtension(configs=None):
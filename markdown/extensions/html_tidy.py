@@ -12,6 +12,11 @@ for example, to output HTML rather than XHTML, set ``output_xhtml=0``. To
 indent the output, set ``indent=auto`` and to have Tidy wrap the output in 
 ``<html>`` and ``<body>`` tags, set ``show_body_only=0``.
 
+To only make the output smaller, the ``minify`` option of Markdown needs
+neither Tidy nor a second pass over the html: the serializer leaves out
+the whitespace, end tags and attribute quotes which are not needed as it
+writes the output.
+
 [HTML Tidy]: http://tidy.sourceforge.net/
 [uTidylib]: http://utidylib.berlios.de/
 [options]: http://tidy.sourceforge.net/docs/quickref.html
@@ -55,6 +55,8 @@ class MetaExtension (markdown.Extension):
         """ Add MetaPreprocessor to Markdown instance. """
 
         md.preprocessors.add("meta", MetaPreprocessor(md), "_begin")
+        # `md.Meta` belongs to the conversion
+        md.context_attributes = md.context_attributes + ('Meta',)
 
 
 class MetaPreprocessor(markdown.preprocessors.Preprocessor):
@@ -62,30 +64,35 @@ class MetaPreprocessor(markdown.preprocessors.Preprocessor):
 
     def run(self, lines):
         """ Parse Meta-Data and store in Markdown.Meta. """
-        meta = {}
-        key = None
-        while 1:
-            line = lines.pop(0)
-            if line.strip() == '':
-                break # blank line - done
-            m1 = META_RE.match(line)
-            if m1:
-                key = m1.group('key').lower().strip()
-                value = m1.group('value').strip()
-                try:
-                    meta[key].append(value)
-                except KeyError:
-                    meta[key] = [value]
-            else:
-                m2 = META_MORE_RE.match(line)
-                if m2 and key:
-                    # Add another line to existing key
-                    meta[key].append(m2.group('value').strip())
-                else:
-                    lines.insert(0, line)
-                    break # no meta data - done
-        self.markdown.Meta = meta
+        self.markdown.Meta = get_meta(lines)
         return lines
+
+
+def get_meta(lines):
+    """ Remove the Meta-Data from the start of `lines` and return it. """
+    meta = {}
+    key = None
+    while 1:
+        line = lines.pop(0)
+        if line.strip() == '':
+            break # blank line - done
+        m1 = META_RE.match(line)
+        if m1:
+            key = m1.group('key').lower().strip()
+            value = m1.group('value').strip()
+            try:
+                meta[key].append(value)
+            except KeyError:
+                meta[key] = [value]
+        else:
+            m2 = META_MORE_RE.match(line)
+            if m2 and key:
+                # Add another line to existing key
+                meta[key].append(m2.group('value').strip())
+            else:
+                lines.insert(0, line)
+                break # no meta data - done
+    return meta
         
 
 def makeExtension(configs={}):
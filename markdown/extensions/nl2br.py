@@ -28,6 +28,7 @@ class Nl2BrExtension(markdown.Extension):
 
     def extendMarkdown(self, md, md_globals):
         br_tag = markdown.inlinepatterns.SubstituteTagPattern(BR_RE, 'br')
+        br_tag.triggers = '\n'
         md.inlinePatterns.add('nl', br_tag, '_end')
 
 
@@ -24,8 +24,9 @@ Copyright 2011
 
 import re
 import markdown
-from markdown.inlinepatterns import SimpleTagPattern
+from markdown.inlinepatterns import SimpleTagPattern, EmphasisScanner
 
+# The patterns use an EmphasisScanner, which matches as these do.
 SMART_STRONG_RE = r'(?<!\w)(_{2})(?!_)(.+?)(?<!_)\2(?!\w)'
 STRONG_RE = r'(\*{2})(.+?)\2'
 
@@ -34,8 +35,13 @@ class SmartEmphasisExtension(markdown.extensions.Extension):
 
     def extendMarkdown(self, md, md_globals):
         """ Modify inline patterns. """
-        md.inlinePatterns['strong'] = SimpleTagPattern(STRONG_RE, 'strong')
-        md.inlinePatterns.add('strong2', SimpleTagPattern(SMART_STRONG_RE, 'strong'), '>emphasis2')
+        strong = SimpleTagPattern(EmphasisScanner('strong', ('**',)),
+                                  'strong')
+        strong.triggers = '*'
+        strong2 = SimpleTagPattern(EmphasisScanner('smart_strong'), 'strong')
+        strong2.triggers = '_'
+        md.inlinePatterns['strong'] = strong
+        md.inlinePatterns.add('strong2', strong2, '>emphasis2')
 
 def makeExtension(configs={}):
     return SmartEmphasisExtension(configs=dict(configs))
@@ -13,6 +13,9 @@ from markdown.util import etree
 from markdown.extensions.headerid import slugify, unique, itertext
 
 import re
+import copy
+
+HEADER_RE = re.compile("[Hh][123456]")
 
 
 class TocTreeprocessor(markdown.treeprocessors.Treeprocessor):
@@ -23,104 +26,140 @@ class TocTreeprocessor(markdown.treeprocessors.Treeprocessor):
                 yield parent, child
 
     def run(self, doc):
-        marker_found = False
+        div = self.make_div()
+
+        # Get a list of id attributes
+        used_ids = []
+        for c in doc.getiterator():
+            if "id" in c.attrib:
+                used_ids.append(c.attrib["id"])
 
+        headers, markers = self.find(doc)
+        for (p, c) in markers:
+            # To keep the output from screwing up the
+            # validation by putting a <div> inside of a <p>
+            # we actually replace the <p> in its entirety.
+            for i in range(len(p)):
+                if p[i] == c:
+                    p[i] = div
+                    break
+        self.build(div, [(c, text) for (p, c, text) in headers], used_ids)
+
+        if markers:
+            # Kept out of the plain text, where it would repeat the headers.
+            # The copy is serialized below, so the document is left as is.
+            self.markdown.context.text_excluded.append(div)
+            div = copy.deepcopy(div)
+        # searialize and attach to markdown instance.
+        prettify = self.markdown.treeprocessors.get('prettify')
+        if prettify: prettify.run(div)
+        toc = self.markdown.serializer(div)
+        for pp in self.markdown.postprocessors.values():
+            toc = pp.run(toc)
+        self.markdown.toc = toc
+
+    def make_div(self):
+        """ Return the empty toc div, with its title. """
         div = etree.Element("div")
         div.attrib["class"] = "toc"
-        last_li = None
 
         # Add title to the div
         if self.config["title"]:
             header = etree.SubElement(div, "span")
             header.attrib["class"] = "toctitle"
             header.text = self.config["title"]
+        return div
 
-        level = 0
-        list_stack=[div]
-        header_rgx = re.compile("[Hh][123456]")
-
-        # Get a list of id attributes
-        used_ids = []
-        for c in doc.getiterator():
-            if "id" in c.attrib:
-                used_ids.append(c.attrib["id"])
+    def find(self, doc):
+        """
+        Return the headers of the document, as (parent, header, text) tuples
+        in the order of the toc, and the elements which hold the marker, as
+        (parent, element) tuples.
 
+        """
+        headers = []
+        markers = []
         for (p, c) in self.iterparent(doc):
             text = ''.join(itertext(c)).strip()
             if not text:
                 continue
 
-            # To keep the output from screwing up the
-            # validation by putting a <div> inside of a <p>
-            # we actually replace the <p> in its entirety.
             # We do not allow the marker inside a header as that
             # would causes an enless loop of placing a new TOC 
             # inside previously generated TOC.
-
             if c.text and c.text.strip() == self.config["marker"] and \
-               not header_rgx.match(c.tag) and c.tag not in ['pre', 'code']:
-                for i in range(len(p)):
-                    if p[i] == c:
-                        p[i] = div
-                        break
-                marker_found = True
-                    
-            if header_rgx.match(c.tag):
-                try:
-                    tag_level = int(c.tag[-1])
-                    
-                    while tag_level < level:
-                        list_stack.pop()
-                        level -= 1
-
-                    if tag_level > level:
-                        newlist = etree.Element("ul")
-                        if last_li:
-                            last_li.append(newlist)
-                        else:
-                            list_stack[-1].append(newlist)
-                        list_stack.append(newlist)
-                        if level == 0:
-                            level = tag_level
-                        else:
-                            level += 1
-
-                    # Do not override pre-existing ids 
-                    if not "id" in c.attrib:
-                        id = unique(self.config["slugify"](text, '-'), used_ids)
-                        c.attrib["id"] = id
+               not HEADER_RE.match(c.tag) and c.tag not in ['pre', 'code']:
+                markers.append((p, c))
+
+            if HEADER_RE.match(c.tag):
+                headers.append((p, c, text))
+        return headers, markers
+
+    def build(self, div, headers, used_ids):
+        """
+        Add the nested lists of links to the (header, text) pairs of
+        `headers` to the toc div. Headers without an id are given one not in
+        `used_ids`. Returns the links added, as (header, link) pairs.
+
+        """
+        level = 0
+        list_stack=[div]
+        last_li = None
+        links = []
+        for (c, text) in headers:
+            try:
+                tag_level = int(c.tag[-1])
+                
+                while tag_level < level:
+                    list_stack.pop()
+                    level -= 1
+
+                if tag_level > level:
+                    newlist = etree.Element("ul")
+                    if last_li:
+                        last_li.append(newlist)
+                    else:
+                        list_stack[-1].append(newlist)
+                    list_stack.append(newlist)
+                    if level == 0:
+                        level = tag_level
                     else:
-                        id = c.attrib["id"]
-
-                    # List item link, to be inserted into the toc div
-                    last_li = etree.Element("li")
-                    link = etree.SubElement(last_li, "a")
-                    link.text = text
-                    link.attrib["href"] = '#' + id
-
-                    if self.config["anchorlink"] in [1, '1', True, 'True', 'true']:
-                        anchor = etree.Element("a")
-                        anchor.text = c.text
-                        anchor.attrib["href"] = "#" + id
-                        anchor.attrib["class"] = "toclink"
-                        c.text = ""
-                        for elem in c.getchildren():
-                            anchor.append(elem)
-                            c.remove(elem)
-                        c.append(anchor)
-
-                    list_stack[-1].append(last_li)
-                except IndexError:
-                    # We have bad ordering of headers. Just move on.
-                    pass
-        if not marker_found:
-            # searialize and attach to markdown instance.
-            prettify = self.markdown.treeprocessors.get('prettify')
-            if prettify: prettify.run(div)
-            toc = self.markdown.serializer(div)
-            for pp in self.markdown.postprocessors.values():
-                toc = pp.run(toc)
-            self.markdown.toc = toc
+                        level += 1
+
+                # Do not override pre-existing ids 
+                if not "id" in c.attrib:
+                    id = unique(self.config["slugify"](text, '-'), used_ids)
+                    c.attrib["id"] = id
+                else:
+                    id = c.attrib["id"]
+
+                # List item link, to be inserted into the toc div
+                last_li = etree.Element("li")
+                link = etree.SubElement(last_li, "a")
+                link.text = text
+                link.attrib["href"] = '#' + id
+
+                if self.config["anchorlink"] in [1, '1', True, 'True', 'true']:
+                    self.add_anchor(c, id)
+
+                list_stack[-1].append(last_li)
+                links.append((c, link))
+            except IndexError:
+                # We have bad ordering of headers. Just move on.
+                pass
+        return links
+
+    def add_anchor(self, c, id):
+        """ Make the content of the header a link to itself. """
+        anchor = etree.Element("a")
+        anchor.text = c.text
+        anchor.attrib["href"] = "#" + id
+        anchor.attrib["class"] = "toclink"
+        c.text = ""
+        for elem in c.getchildren():
+            anchor.append(elem)
+            c.remove(elem)
+        c.append(anchor)
 
 class TocExtension(markdown.Extension):
     def __init__(self, configs):
@@ -149,6 +188,8 @@ class TocExtension(markdown.Extension):
         # attr_list extension. This must come last because we don't want
         # to redefine ids after toc is created. But we do want toc prettified.
         md.treeprocessors.add("toc", tocext, "<prettify")
+        # `md.toc` belongs to the conversion
+        md.context_attributes = md.context_attributes + ('toc',)
 	
 def makeExtension(configs={}):
     return TocExtension(configs=configs)
@@ -112,6 +112,8 @@ class WikiLinkExtension(markdown.Extension):
 
 
 class WikiLinks(markdown.inlinepatterns.Pattern):
+    triggers = '['
+
     def __init__(self, pattern, config):
         markdown.inlinepatterns.Pattern.__init__(self, pattern)
         self.config = config
@@ -44,6 +44,8 @@ So, we apply the expressions in the following order:
 import util
 import odict
 import re
+import bisect
+import threading
 from urlparse import urlparse, urlunparse
 import sys
 # If you see an ImportError for htmlentitydefs after using 2to3 to convert for 
@@ -60,13 +62,15 @@ def build_inlinepatterns(md_instance, **kwargs):
     inlinePatterns = odict.OrderedDict()
     inlinePatterns["backtick"] = BacktickPattern(BACKTICK_RE)
     inlinePatterns["escape"] = EscapePattern(ESCAPE_RE, md_instance)
-    inlinePatterns["reference"] = ReferencePattern(REFERENCE_RE, md_instance)
-    inlinePatterns["link"] = LinkPattern(LINK_RE, md_instance)
-    inlinePatterns["image_link"] = ImagePattern(IMAGE_LINK_RE, md_instance)
+    inlinePatterns["reference"] = \
+            ReferencePattern(BracketScanner('reference'), md_instance)
+    inlinePatterns["link"] = LinkPattern(BracketScanner('link'), md_instance)
+    inlinePatterns["image_link"] = \
+            ImagePattern(BracketScanner('image_link'), md_instance)
     inlinePatterns["image_reference"] = \
-            ImageReferencePattern(IMAGE_REFERENCE_RE, md_instance)
+            ImageReferencePattern(BracketScanner('image_reference'), md_instance)
     inlinePatterns["short_reference"] = \
-            ReferencePattern(SHORT_REF_RE, md_instance)
+            ReferencePattern(BracketScanner('short_reference'), md_instance)
     inlinePatterns["autolink"] = AutolinkPattern(AUTOLINK_RE, md_instance)
     inlinePatterns["automail"] = AutomailPattern(AUTOMAIL_RE, md_instance)
     inlinePatterns["linebreak"] = SubstituteTagPattern(LINE_BREAK_RE, 'br')
@@ -74,13 +78,20 @@ def build_inlinepatterns(md_instance, **kwargs):
         inlinePatterns["html"] = HtmlPattern(HTML_RE, md_instance)
     inlinePatterns["entity"] = HtmlPattern(ENTITY_RE, md_instance)
     inlinePatterns["not_strong"] = SimpleTextPattern(NOT_STRONG_RE)
-    inlinePatterns["strong_em"] = DoubleTagPattern(STRONG_EM_RE, 'strong,em')
-    inlinePatterns["strong"] = SimpleTagPattern(STRONG_RE, 'strong')
-    inlinePatterns["emphasis"] = SimpleTagPattern(EMPHASIS_RE, 'em')
+    inlinePatterns["strong_em"] = \
+            DoubleTagPattern(EmphasisScanner('strong_em'), 'strong,em')
+    inlinePatterns["strong"] = \
+            SimpleTagPattern(EmphasisScanner('strong'), 'strong')
+    inlinePatterns["emphasis"] = \
+            SimpleTagPattern(EmphasisScanner('emphasis'), 'em')
     if md_instance.smart_emphasis:
-        inlinePatterns["emphasis2"] = SimpleTagPattern(SMART_EMPHASIS_RE, 'em')
+        inlinePatterns["emphasis2"] = \
+            SimpleTagPattern(EmphasisScanner('smart_emphasis'), 'em')
     else:
-        inlinePatterns["emphasis2"] = SimpleTagPattern(EMPHASIS_2_RE, 'em')
+        inlinePatterns["emphasis2"] = \
+            SimpleTagPattern(EmphasisScanner('emphasis2'), 'em')
+    for name, pattern in inlinePatterns.items():
+        pattern.triggers = TRIGGERS[name]
     return inlinePatterns
 
 """
@@ -88,6 +99,9 @@ The actual regular expressions for patterns
 -----------------------------------------------------------------------------
 """
 
+# The default link, reference and image patterns use a BracketScanner, and
+# the emphasis patterns an EmphasisScanner, rather than these expressions,
+# which are kept for extensions using them.
 NOBRACKET = r'[^\]\[]*'
 BRK = ( r'\[('
         + (NOBRACKET + r'(\[')*6
@@ -119,6 +133,28 @@ HTML_RE = r'(\<([a-zA-Z/][^\>]*?|\!--.*?--)\>)'               # <...>
 ENTITY_RE = r'(&[\#a-zA-Z0-9]*;)'               # &amp;
 LINE_BREAK_RE = r'  \n'                     # two spaces at end of line
 
+# Characters of which at least one must be in the text for each of the
+# default patterns to match.
+TRIGGERS = {
+    'backtick': '`',
+    'escape': '\\',
+    'reference': '[',
+    'link': '[',
+    'image_link': '!',
+    'image_reference': '!',
+    'short_reference': '[',
+    'autolink': '<',
+    'automail': '<',
+    'linebreak': '\n',
+    'html': '<',
+    'entity': '&',
+    'not_strong': '*_',
+    'strong_em': '*_',
+    'strong': '*_',
+    'emphasis': '*',
+    'emphasis2': '_',
+}
+
 
 def dequote(string):
     """Remove quotes from around a string."""
@@ -132,11 +168,481 @@ ATTR_RE = re.compile("\{@([^\}]*)=([^\}]*)}") # {@id=123}
 
 def handleAttributes(text, parent):
     """Set values of an element based on attribute definitions ({@id=123})."""
+    if '{@' not in text:
+        # Like ATTR_RE.sub, return a plain string for an AtomicString.
+        return text[:]
     def attributeCallback(match):
         parent.set(match.group(1), match.group(2).replace('\n', ' '))
     return ATTR_RE.sub(attributeCallback, text)
 
 
+"""
+The bracket scanner
+-----------------------------------------------------------------------------
+"""
+
+BRACKET_RE = re.compile(r'[\[\]]')
+SPACE_RE = re.compile(r'\s*', re.UNICODE)
+# The first place an url can end: a paren or quote after optional space
+URL_STOP_RE = re.compile(r'\s*[()\'"]', re.UNICODE)
+# A bracketed url can end at a `>` followed by a paren or a title
+ANGLE_STOP_RE = re.compile(r'>(?=\s*[)\'"])', re.UNICODE)
+# The groups of the nested brackets of BRK, which are not captured
+NO_SPANS = [(-1, -1)] * 6
+TITLE_END_RE = {'"': re.compile(r'"\s*\)', re.UNICODE),
+                "'": re.compile(r"'\s*\)", re.UNICODE)}
+
+
+class ScanMatch:
+    """ A match of a BracketScanner, with the interface of a regex match. """
+
+    def __init__(self, string, spans):
+        self.string = string
+        self.spans = spans
+        self._groups = tuple([string[start:end] if start >= 0 else None
+                              for start, end in spans])
+
+    def group(self, index=0):
+        if index == 0:
+            return self.string
+        return self._groups[index - 1]
+
+    def groups(self):
+        return self._groups
+
+    def span(self, index=0):
+        if index == 0:
+            return 0, len(self.string)
+        return self.spans[index - 1]
+
+    def start(self, index=0):
+        return self.span(index)[0]
+
+    def end(self, index=0):
+        return self.span(index)[1]
+
+
+class Brackets:
+    """
+    The `[` of a text and the `]` which balances each of them, where BRK
+    would match them.
+
+    Brackets are paired as they are needed: `advance` reads the text up
+    to the next place outside of all brackets. The first `ready` items of
+    `opens` are the `[` up to there, all of which are settled.
+
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.brackets = BRACKET_RE.finditer(text)
+        self.opens = []
+        self.pairs = {}
+        self.ready = 0
+        self.done = False
+        # Entries are [index, index of the end of its last child, valid]
+        self.stack = []
+
+    def advance(self):
+        stack = self.stack
+        for m in self.brackets:
+            i = m.start()
+            if self.text[i] == '[':
+                self.opens.append(i)
+                if stack and stack[-1][1] is not None and \
+                        stack[-1][1] != i - 1:
+                    # BRK does not allow text between two nested pairs.
+                    stack[-1][2] = False
+                stack.append([i, None, True])
+            elif stack:
+                start, last, valid = stack.pop()
+                if valid:
+                    self.pairs[start] = i
+                if stack:
+                    stack[-1][1] = i
+                    if not valid:
+                        stack[-1][2] = False
+                else:
+                    self.ready = len(self.opens)
+                    return
+        # The `[` still open are not balanced.
+        self.ready = len(self.opens)
+        self.done = True
+
+
+class BracketScanner:
+    """
+    Find links, references and images in a single pass over the text.
+
+    A BracketScanner takes the place of the compiled regular expression of a
+    Pattern. Its `match` method returns a ScanMatch with the same groups as
+    Pattern's wrapping of LINK_RE, IMAGE_LINK_RE, REFERENCE_RE,
+    IMAGE_REFERENCE_RE or SHORT_REF_RE (depending on `kind`), or None.
+
+    Balanced brackets are paired with a stack, so unlike BRK there is no
+    limit to how deeply they nest and no backtracking on unmatched ones.
+    Urls are scanned once from each place they may start, with the results
+    shared between places, so a text with many `[` or `(` takes linear time.
+    The groups of repeated subexpressions (the nested brackets of BRK and
+    the last item of a link's url) are always None.
+
+    """
+
+    GROUPS = {'link': 14, 'image_link': 11, 'reference': 10,
+              'image_reference': 10, 'short_reference': 3}
+    # What must follow the brackets, to pass over others quickly
+    TAIL_STARTS = {'link': re.compile(r'\('),
+                   'image_link': re.compile(r'[\s(]', re.UNICODE),
+                   'reference': re.compile(r'\s?\[', re.UNICODE),
+                   'image_reference': re.compile(r'\s?\[', re.UNICODE),
+                   'short_reference': None}
+    # What any match must contain, to pass over other texts quickly
+    NEEDS = {'link': re.compile(r'\]\('),
+             'image_link': re.compile(r'!\['),
+             'reference': re.compile(r'\]\s?\[', re.UNICODE),
+             'image_reference': re.compile(r'!\['),
+             'short_reference': re.compile(r'\[[^\]]')}
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.size = self.GROUPS[kind]
+        self.needs = self.NEEDS[kind]
+        self.tailStart = self.TAIL_STARTS[kind]
+        self.image = kind.startswith('image')
+        if kind == 'link':
+            self.scanTail = self.scanLinkTail
+        elif kind == 'image_link':
+            self.scanTail = self.scanImageTail
+        else:
+            self.scanTail = self.scanReferenceTail
+        # The Brackets of the last text scanned and the scanning state, kept
+        # per thread as threads may share the pattern
+        self._local = threading.local()
+
+    def match(self, text):
+        if self.needs.search(text) is None:
+            return None
+        if self.kind == 'short_reference':
+            return self.matchShortReference(text)
+        last = getattr(self._local, 'last', None)
+        if last is not None and len(text) <= len(last[0].text) and \
+                last[0].text.endswith(text):
+            # After a match which made no element, the InlineProcessor
+            # goes on with the rest of the same text. What is known about
+            # the end of a text holds for it alone, so keep all of it.
+            brackets, state = last
+            offset = len(brackets.text) - len(text)
+        else:
+            brackets = Brackets(text)
+            state = {}
+            self._local.last = (brackets, state)
+            offset = 0
+
+        whole = brackets.text
+        opens = brackets.opens
+        i = bisect.bisect_left(opens, offset)
+        while 1:
+            if i >= brackets.ready:
+                if brackets.done:
+                    return None
+                brackets.advance()
+                continue
+            start = opens[i]
+            i += 1
+            if start < offset:
+                continue
+            image = start > offset and whole[start - 1] == '!'
+            if image == self.image and start in brackets.pairs:
+                close = brackets.pairs[start]
+                if self.tailStart.match(whole, close + 1) is not None:
+                    tail = self.scanTail(whole, close + 1, state)
+                    if tail is not None:
+                        end, spans = tail
+                        if self.image:
+                            start -= 1
+                        return self.makeMatch(text, offset, start, close,
+                                              end, spans)
+
+    def makeMatch(self, text, offset, start, close, end, spans):
+        """
+        Return a ScanMatch for `text` from the spans of a match in a text
+        which `text` ends, `offset` characters longer.
+
+        """
+        inner = start + 1
+        if self.image:
+            inner += 1
+        allSpans = [(0, start - offset), (inner - offset, close - offset)]
+        allSpans.extend(NO_SPANS)
+        for i in range(9, self.size):
+            span = spans.get(i)
+            if span is None:
+                allSpans.append((-1, -1))
+            else:
+                allSpans.append((span[0] - offset, span[1] - offset))
+        allSpans.append(self.suffix(text, end - offset))
+        return ScanMatch(text, allSpans)
+
+    def suffix(self, text, end):
+        """ Return the span of the rest of the text, as matched by `(.*?)$`. """
+        return suffixSpan(text, end)
+
+    def matchShortReference(self, text):
+        """ Match SHORT_REF_RE: brackets with text and no `]` inside. """
+        start = -1
+        close = -1
+        while 1:
+            start = text.find('[', start + 1)
+            if start < 0:
+                return None
+            if start > 0 and text[start - 1] == '!':
+                continue
+            if close < start:
+                close = text.find(']', start + 1)
+                if close < 0:
+                    return None
+            if close > start + 1:
+                return ScanMatch(text, [(0, start), (start + 1, close),
+                                        self.suffix(text, close + 1)])
+
+    def find(self, text, sub, pos, state):
+        """ Return the index of the first `sub` from `pos` or -1. """
+        key = 'no' + sub
+        if pos >= state.get(key, len(text) + 1):
+            return -1
+        found = text.find(sub, pos)
+        if found < 0:
+            # Nor from anywhere after
+            state[key] = pos
+        return found
+
+    def scanTitle(self, text, quote, state):
+        """
+        Return the spans of a title opening at `quote` which is followed
+        by the closing paren of the link, or None.
+
+        """
+        char = text[quote]
+        key = 'noTitle' + char
+        if quote + 1 >= state.get(key, len(text) + 1):
+            return None
+        m = TITLE_END_RE[char].search(text, quote + 1)
+        if m is None:
+            # No title closing with this quote from here on.
+            state[key] = quote + 1
+            return None
+        return m.end(), {11: (quote, m.end() - 1), 12: (quote, quote + 1),
+                         13: (quote + 1, m.start())}
+
+    def scanLinkRest(self, text, pos, state):
+        """ Match the optional title and closing paren of a link's url. """
+        after = SPACE_RE.match(text, pos).end()
+        char = text[after:after + 1]
+        if char == ')':
+            return after + 1, {}
+        if char in ('"', "'"):
+            return self.scanTitle(text, after, state)
+        return None
+
+    def scanUrl(self, text, pos, state):
+        """
+        Return the (url end, match end, title spans) of a url without
+        angle brackets starting at `pos`, or None.
+
+        The url ends at the first place from which a title and the closing
+        paren follow. A `(` is skipped up to the first `)` after it. Each
+        place that is scanned from records the result it led to, so that
+        scanning from another link which reaches it again stops there.
+
+        """
+        seen = state.setdefault('urls', {})
+        visited = []
+        result = None
+        while 1:
+            if pos in seen:
+                result = seen[pos]
+                break
+            visited.append(pos)
+            m = URL_STOP_RE.search(text, pos)
+            if m is None:
+                break
+            stop = m.end() - 1
+            char = text[stop]
+            if char == ')':
+                result = (m.start(), stop + 1, {})
+                break
+            if char == '(':
+                close = self.find(text, ')', stop + 1, state)
+                if close < 0:
+                    break
+                pos = close + 1
+                continue
+            title = self.scanTitle(text, stop, state)
+            if title is not None:
+                result = (m.start(), title[0], title[1])
+                break
+            pos = stop + 1
+        for pos in visited:
+            seen[pos] = result
+        return result
+
+    def scanLinkTail(self, text, pos, state):
+        """ Match the `(url "title")` of LINK_RE after the brackets. """
+        if text[pos:pos + 1] != '(':
+            return None
+        start = SPACE_RE.match(text, pos + 1).end()
+        if text[start:start + 1] == '<' and \
+                start + 1 < state.get('noAngle', len(text) + 1):
+            angle = start + 1
+            while 1:
+                m = ANGLE_STOP_RE.search(text, angle)
+                if m is None:
+                    state['noAngle'] = start + 1
+                    break
+                rest = self.scanLinkRest(text, m.end(), state)
+                if rest is not None:
+                    spans = rest[1]
+                    spans[9] = (start, m.end())
+                    return rest[0], spans
+                angle = m.end()
+        url = self.scanUrl(text, start, state)
+        if url is None:
+            return None
+        urlEnd, end, spans = url
+        spans = spans.copy()
+        spans[9] = (start, urlEnd)
+        return end, spans
+
+    def scanImageTail(self, text, pos, state):
+        """ Match the `(url)` of IMAGE_LINK_RE after the brackets. """
+        pos = SPACE_RE.match(text, pos).end()
+        if text[pos:pos + 1] != '(':
+            return None
+        start = pos + 1
+        if text[start:start + 1] == '<':
+            close = self.find(text, '>)', start + 1, state)
+            if close >= 0:
+                return close + 2, {9: (start, close + 1)}
+        close = self.find(text, ')', start, state)
+        if close < 0:
+            return None
+        return close + 1, {9: (start, close), 10: (start, close)}
+
+    def scanReferenceTail(self, text, pos, state):
+        """ Match the `[id]` of REFERENCE_RE after the brackets. """
+        if text[pos:pos + 1] != '[':
+            if SPACE_RE.match(text, pos, pos + 1).end() == pos or \
+                    text[pos + 1:pos + 2] != '[':
+                return None
+            pos += 1
+        close = self.find(text, ']', pos + 1, state)
+        if close < 0:
+            return None
+        return close + 1, {9: (pos + 1, close)}
+
+
+"""
+The emphasis scanner
+-----------------------------------------------------------------------------
+"""
+
+# The delimiters of each kind of emphasis
+EMPHASIS_DELIMITERS = {'strong_em': ('***', '___'),
+                       'strong': ('**', '__'),
+                       'emphasis': ('*',),
+                       'emphasis2': ('_',),
+                       'smart_emphasis': ('_',),
+                       'smart_strong': ('__',)}
+# A `*` which EMPHASIS_RE may open, before a character other than `*`
+STAR_OPEN_RE = re.compile(r'\*(?=[^\*])')
+# Where SMART_EMPHASIS_RE may open and close, by delimiter length
+SMART_OPEN_RE = {1: re.compile(r'(?<!\w)_(?!_)', re.UNICODE),
+                 2: re.compile(r'(?<!\w)__(?!_)', re.UNICODE)}
+SMART_CLOSE_RE = {1: re.compile(r'(?<!_)_(?!\w)', re.UNICODE),
+                  2: re.compile(r'(?<!_)__(?!\w)', re.UNICODE)}
+
+
+class EmphasisScanner:
+    """
+    Find emphasis and strong without backtracking.
+
+    An EmphasisScanner takes the place of the compiled regular expression of
+    a Pattern, as a BracketScanner does. Its `match` method returns a
+    ScanMatch with the same groups as Pattern's wrapping of STRONG_EM_RE,
+    STRONG_RE, EMPHASIS_RE, EMPHASIS_2_RE, SMART_EMPHASIS_RE or the
+    smart_strong extension's SMART_STRONG_RE (depending on `kind`), or None.
+
+    The lazy `(.+?)` of those expressions scans to the end of the text from
+    each delimiter which is never closed, so a text with many unmatched `*`
+    or `_` took quadratic time. Where a delimiter may close does not depend
+    on where it opened, so if the first delimiter which may open has no
+    delimiter to close it, no later one has. The scanner only looks for the
+    first opening delimiter and the first closing one after it.
+
+    """
+
+    def __init__(self, kind, delimiters=None):
+        self.kind = kind
+        self.delimiters = delimiters or EMPHASIS_DELIMITERS[kind]
+        if kind == 'emphasis':
+            self.scan = self.scanEmphasis
+        elif kind.startswith('smart'):
+            self.scan = self.scanSmart
+        else:
+            self.scan = self.scanDelimiters
+
+    def match(self, text):
+        found = self.scan(text)
+        if found is None:
+            return None
+        start, size, close = found
+        return ScanMatch(text, [(0, start), (start, start + size),
+                                (start + size, close),
+                                suffixSpan(text, close + size)])
+
+    def scanDelimiters(self, text):
+        """ Match `(d)(.+?)\\2` for each delimiter d: the first wins. """
+        found = None
+        for delimiter in self.delimiters:
+            start = text.find(delimiter)
+            if start < 0 or found is not None and start > found[0]:
+                continue
+            size = len(delimiter)
+            close = text.find(delimiter, start + size + 1)
+            if close >= 0:
+                found = start, size, close
+        return found
+
+    def scanEmphasis(self, text):
+        """ Match EMPHASIS_RE: a `*` and the next one, with text between. """
+        m = STAR_OPEN_RE.search(text)
+        if m is None:
+            return None
+        close = text.find('*', m.end() + 1)
+        if close < 0:
+            return None
+        return m.start(), 1, close
+
+    def scanSmart(self, text):
+        """ Match `_` or `__` outside of words, as SMART_EMPHASIS_RE does. """
+        size = len(self.delimiters[0])
+        m = SMART_OPEN_RE[size].search(text)
+        if m is None:
+            return None
+        close = SMART_CLOSE_RE[size].search(text, m.end() + 1)
+        if close is None:
+            return None
+        return m.start(), size, close.start()
+
+
+def suffixSpan(text, end):
+    """ Return the span of the rest of the text, as matched by `(.*?)$`. """
+    if end < len(text) and text.endswith('\n'):
+        # `$` matches before a newline at the end of the text
+        return end, len(text) - 1
+    return end, len(text)
+
+
 """
 The pattern classes
 -----------------------------------------------------------------------------
@@ -145,18 +651,28 @@ The pattern classes
 class Pattern:
     """Base class that inline patterns subclass. """
 
+    # A string of characters of which at least one must be in a text for
+    # the pattern to match it, or None if the pattern may match any text.
+    # The InlineProcessor does not try the pattern on other texts.
+    triggers = None
+
     def __init__(self, pattern, markdown_instance=None):
         """
         Create an instant of an inline pattern.
 
         Keyword arguments:
 
-        * pattern: A regular expression that matches a pattern
+        * pattern: A regular expression that matches a pattern, or an
+          object which matches like a compiled one (see BracketScanner)
 
         """
         self.pattern = pattern
-        self.compiled_re = re.compile("^(.*?)%s(.*?)$" % pattern, 
-                                      re.DOTALL | re.UNICODE)
+        if isinstance(pattern, basestring):
+            self.compiled_re = re.compile("^(.*?)%s(.*?)$" % pattern, 
+                                          re.DOTALL | re.UNICODE)
+        else:
+            # An object with a `match` method, such as a BracketScanner
+            self.compiled_re = pattern
 
         # Api for Markdown to pass safe_mode into instance
         self.safe_mode = False
@@ -0,0 +1,126 @@
+"""
+METADATA EXTRACTION
+=============================================================================
+
+Read the metadata of a Markdown document without converting it: its meta
+header, its title, its headers and its word count.
+
+    >>> import markdown
+    >>> info = markdown.extract_metadata(u'Title: Notes\\n\\n# Intro\\n\\nSome text.')
+    >>> info['title'], info['headings'], info['word_count']
+    (u'Notes', [(1, u'Intro')], 3)
+
+Only the meta header is parsed as the meta extension does. The rest of the
+document is scanned line by line for hash and setext headers, skipping
+fenced and indented code. No blocks are parsed, no inline markup is
+processed and nothing is serialized, so headers are returned as their
+source text. Headers nested in lists or blockquotes are not found, and the
+title of a header is not unescaped.
+
+"""
+
+import re
+
+# A hash header line (see HashHeaderProcessor)
+HASH_HEADER_RE = re.compile(r'^(?P<level>#{1,6})(?P<header>.*?)#*$')
+# The underline of a setext header (see SetextHeaderProcessor)
+SETEXT_RE = re.compile(r'^[=-]+[ ]*$')
+# A horizontal rule, which ends the block before it (see HRProcessor)
+HR_RE = re.compile(r'^[ ]{0,3}((-+[ ]{0,2}){3,}|(_+[ ]{0,2}){3,}|'
+                   r'(\*+[ ]{0,2}){3,})[ ]*$')
+# A word: a run of non-space characters with a letter or digit in it
+WORD_RE = re.compile(r'\S*\w\S*', re.UNICODE)
+# The fence of a fenced code block (see the fenced_code extension)
+FENCE_RE = re.compile(r'^(?P<fence>~{3,}|`{3,})[ ]*'
+                      r'(\{?\.?[a-zA-Z0-9_+-]*\}?)?[ ]*$')
+
+
+def extract_metadata(source, tab_length=4):
+    """
+    Return the metadata of the Markdown text `source` as a dict.
+
+    * meta: the meta header, as the meta extension stores it in
+      ``Markdown.Meta``.
+    * title: the first value of the ``title`` key of the meta header, or
+      else the text of the first header, or None.
+    * headings: a list of ``(level, text)`` tuples, one per header.
+    * word_count: the number of words after the meta header. Markup which
+      stands apart, such as a list bullet, is not counted.
+
+    """
+    # Imported here, as the extension imports markdown itself.
+    from extensions.meta import get_meta
+
+    source = unicode(source)
+    source = source.replace("\r\n", "\n").replace("\r", "\n")
+    lines = source.expandtabs(tab_length).split("\n") + ['', '']
+    meta = get_meta(lines)
+    headings = get_headings(lines, tab_length)
+    if meta.get('title'):
+        title = meta['title'][0]
+    elif headings:
+        title = headings[0][1]
+    else:
+        title = None
+    return {
+        'meta': meta,
+        'title': title,
+        'headings': headings,
+        'word_count': len(WORD_RE.findall('\n'.join(lines))),
+    }
+
+
+def get_headings(lines, tab_length=4):
+    """ Return a list of the ``(level, text)`` of the headers in `lines`. """
+    headings = []
+    indent = ' ' * tab_length
+    # The fence of the open fenced code block, and the state where it opened
+    fence = None
+    opened = None
+    # The fences found to have no closing fence, which are not code
+    unclosed = set()
+    # Whether the line starts a block, as after a blank line
+    start = True
+    # Whether the line is the underline of a setext header
+    underline = False
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        i += 1
+        if fence is not None:
+            if line.rstrip(' ') == fence:
+                fence = None
+                start = True
+            elif i == len(lines):
+                # Scan again from the fence, as a line of text.
+                i, start, count = opened
+                unclosed.add(i)
+                del headings[count:]
+                fence = None
+            continue
+        if underline or not line.strip():
+            underline = False
+            start = True
+            continue
+        if start and line.startswith(indent):
+            # Indented code runs on to the next line which is not indented.
+            continue
+        if i - 1 not in unclosed:
+            m = FENCE_RE.match(line)
+            if m:
+                fence = m.group('fence')
+                opened = (i - 1, start, len(headings))
+                continue
+        m = HASH_HEADER_RE.match(line)
+        if m:
+            headings.append((len(m.group('level')),
+                             m.group('header').strip()))
+            start = True
+            continue
+        if start and i < len(lines) and SETEXT_RE.match(lines[i]):
+            level = lines[i].startswith('=') and 1 or 2
+            headings.append((level, line.strip()))
+            underline = True
+            continue
+        start = bool(HR_RE.match(line))
+    return headings
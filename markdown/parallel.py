@@ -0,0 +1,459 @@
+"""
+PARALLEL CONVERSION
+=============================================================================
+
+Convert a very large document on several processors at once.
+
+    from markdown import parallel
+    html = parallel.convert(text, jobs=4, extensions=['footnotes'])
+
+The document is cut into chunks as `markdown.streaming` cuts it, where the
+blocks on either side of the cut are parsed alike whole or apart:
+
+1. This process runs the preprocessors over the whole source to collect
+   what any part of the document may refer to: reference definitions,
+   footnote definitions, abbreviations and the meta header.
+2. A pool of worker processes, each with a Markdown instance made with the
+   same options, parses, processes and serializes the chunks, with the
+   definitions of the whole document.
+3. The html of the chunks is joined in order.
+
+Header ids and footnotes are made consistent over the whole document:
+
+* Footnotes are numbered in the order of their definitions in the whole
+  document. They go where the first chunk with the marker puts them, or
+  after the last chunk.
+* Workers leave a placeholder for each header id of the headerid
+  extension. The ids are then made unique over the whole document, in
+  order, as `Markdown.convert` makes them.
+* Workers leave a placeholder for the table of contents of the toc
+  extension and for each id it gives a header, and return the headers.
+  This process then builds the table of contents of the whole document
+  and puts it and the ids in place.
+
+The output is then that of `Markdown.convert`, with the same exceptions as
+for streaming. Only the processors in `streaming.STREAMABLE` and `KNOWN`
+are known to work on chunks. For a Markdown instance with others, such as
+that of the rss extension, the document is converted whole in this
+process, as it is when the toc makes links of headers out of order. A
+warning is logged then.
+
+"""
+
+import re
+import sys
+import codecs
+import logging
+import util
+import streaming
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+logger = logging.getLogger('MARKDOWN')
+
+# Smallest size, in characters, of the chunks given to workers. Larger
+# documents are cut in about four chunks per worker.
+MIN_CHUNK_SIZE = 16 * 1024
+
+HEADER_TAGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+# Placeholder of the id of the n-th header of a chunk
+HEADER_ID = util.STX + "headerid:%s" + util.ETX
+HEADER_ID_RE = re.compile(HEADER_ID % r'([0-9]+)')
+# Placeholders of the toc of the toc extension, of the id it gives the n-th
+# header of a chunk and of the text of its n-th link
+TOC = util.STX + "toc" + util.ETX
+TOC_ID = util.STX + "tocid:%s" + util.ETX
+TOC_ID_RE = re.compile(TOC_ID % r'([0-9]+)')
+TOC_ID_ATTR_RE = re.compile(r' id=(["\']?)%s\1' % (TOC_ID % r'([0-9]+)'))
+TOC_LINK = util.STX + "toclink:%s" + util.ETX
+TOC_LINK_RE = re.compile(TOC_LINK % r'([0-9]+)')
+
+# The processors which work on chunks here, besides those which stream.
+KNOWN = {'treeprocessor': ['toc']}
+
+# The Markdown instance of a worker process, and the definitions of the
+# document it converts chunks of
+_md = None
+_state = None
+
+
+def convert(source, jobs=None, chunk_size=None, **md_options):
+    """
+    Convert a Markdown document with a pool of worker processes and return
+    the html.
+
+    Keyword arguments:
+
+    * source: Source text as a Unicode string.
+    * jobs: Number of worker processes. Defaults to the number of CPUs.
+      With 1, or where processes are unavailable, the chunks are converted
+      in this process.
+    * chunk_size: Size, in characters, from which a chunk is ended at the
+      next place it can be cut. Defaults to a size which gives each worker
+      about four chunks.
+    * Any arguments accepted by the Markdown class.
+
+    """
+    md = markdown_instance(md_options)
+    reason = streaming.unstreamable(md, known=KNOWN)
+    if reason is not None:
+        logger.warning('Converting without parallel chunks: %s' % reason)
+        return md.convert(source)
+    if jobs is None:
+        jobs = multiprocessing and multiprocessing.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(MIN_CHUNK_SIZE, len(source) // (jobs * 4))
+
+    md._reset_context()
+    sizes = streaming.collect(md, _lines(md, source), chunk_size)
+    if sizes is None:
+        return u""
+
+    footnotes = streaming.get_footnotes(md)
+    tasks = []
+    place = footnotes is not None
+    for number, lines in enumerate(streaming.chunks(_lines(md, source),
+                                                    sizes)):
+        # Only the first chunk with the marker may place the footnotes.
+        marker = place and _has_marker(footnotes, lines)
+        place = place and not marker
+        tasks.append((number, lines, marker))
+    results = _map(md_options, _definitions(md), tasks, jobs)
+
+    if footnotes is not None and not [r for r in results if r[2]]:
+        # Place the footnotes after the last chunk.
+        first = not [r for r in results if r[0].strip()]
+        root = util.etree.Element(md.doc_tag)
+        results.append(_process(md, root, True, first, last=True))
+
+    # Imported here, as extensions import markdown itself.
+    from extensions.headerid import unique
+    used = []
+    header_ids = [[unique(id, used) for id in r[1]] for r in results]
+    toc = None
+    if 'toc' in md.treeprocessors:
+        toc = _build_toc(md, [r[4] for r in results], header_ids)
+        if toc is None:
+            logger.warning('Converting without parallel chunks: the toc '
+                           'anchors headers which are out of order')
+            return md.convert(source)
+
+    data = []
+    output = streaming.Output(data.append)
+    for index, (html, ids, placed, raw_html_found, marks) in \
+            enumerate(results):
+        html = _set_header_ids(html, header_ids[index])
+        if toc is not None:
+            html = _set_toc(html, toc[0], toc[1][index])
+        output.add(html)
+        md.raw_html_found = md.raw_html_found or raw_html_found
+    return u"".join(data)
+
+
+def convert_file(input=None, output=None, encoding=None, jobs=None,
+                 **md_options):
+    """
+    Convert a Markdown file with a pool of worker processes (see `convert`).
+
+    The arguments are those of `Markdown.convertFile` and `convert`.
+
+    """
+    encoding = encoding or "utf-8"
+    if input:
+        if isinstance(input, basestring):
+            input_file = codecs.open(input, mode="r", encoding=encoding)
+        else:
+            input_file = codecs.getreader(encoding)(input)
+        text = input_file.read()
+        input_file.close()
+    else:
+        text = sys.stdin.read()
+        if not isinstance(text, unicode):
+            text = text.decode(encoding)
+    text = text.lstrip(u'\ufeff') # remove the byte-order mark
+
+    html = convert(text, jobs, **md_options)
+
+    write, close = streaming.writer(output, encoding)
+    try:
+        write(html)
+    finally:
+        close()
+
+
+def markdown_instance(md_options):
+    """ Return a Markdown instance made with `md_options`. """
+    # Imported here, as markdown imports this module.
+    import markdown
+    return markdown.Markdown(**md_options)
+
+
+def _lines(md, source):
+    """ Return an iterator of the lines of the source, split as streamed. """
+    return streaming.split_lines([source], md.tab_length)
+
+
+def _has_marker(footnotes, lines):
+    """ Whether the lines hold the marker of the place of the footnotes. """
+    marker = footnotes.getConfig("PLACE_MARKER")
+    for line in lines:
+        if marker in line:
+            return True
+    return False
+
+
+def _definitions(md):
+    """ Return what the document defines, as collected by `md`. """
+    context = md.context
+    patterns = []
+    if context.inlinePatterns is not None:
+        # The patterns of the abbreviations, after those of the instance
+        patterns = [(key, pattern) for key, pattern in
+                    context.inlinePatterns.items()
+                    if key not in md.inlinePatterns]
+    footnotes = streaming.get_footnotes(md)
+    notes = None
+    if footnotes is not None:
+        notes = (context.footnote_prefix, footnotes.footnotes.items())
+    return {'references': md.references.copy(),
+            'patterns': patterns,
+            'footnotes': notes,
+            'meta': getattr(context, 'Meta', None)}
+
+
+def _define(md, state):
+    """ Give the conversion of `md` what the document defines. """
+    context = md.context
+    md.references.update(state['references'])
+    if state['patterns']:
+        if context.inlinePatterns is None:
+            context.inlinePatterns = md.inlinePatterns.copy()
+        for key, pattern in state['patterns']:
+            context.inlinePatterns[key] = pattern
+    if state['footnotes'] is not None:
+        footnotes = streaming.get_footnotes(md)
+        context.footnote_prefix, notes = state['footnotes']
+        for id, text in notes:
+            footnotes.setFootnote(id, text)
+    if state['meta'] is not None:
+        md.Meta = state['meta']
+
+
+def _map(md_options, state, tasks, jobs):
+    """ Convert the chunks of `tasks` in a pool and return the results. """
+    jobs = min(jobs, len(tasks))
+    pool = None
+    if jobs > 1 and multiprocessing is not None:
+        try:
+            pool = multiprocessing.Pool(jobs, _init_worker,
+                                        (md_options, state))
+        except (OSError, NotImplementedError):
+            pool = None
+    if pool is None:
+        _init_worker(md_options, state)
+        return [_convert_chunk(task) for task in tasks]
+    try:
+        return pool.map(_convert_chunk, tasks, 1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _init_worker(md_options, state):
+    """ Build the Markdown instance reused by this worker. """
+    global _md, _state
+    _md = markdown_instance(md_options)
+    _state = state
+
+
+class _ChunkIds(list):
+    """
+    The header ids of a chunk. The ids of the other chunks are not known
+    here, so each id is taken as unused and made unique later.
+
+    """
+
+    def __contains__(self, id):
+        return False
+
+
+def _convert_chunk(task):
+    """
+    Convert the lines of a chunk with the worker's Markdown instance.
+
+    Returns what `_process` returns.
+
+    """
+    number, lines, place = task
+    md = _md
+    md._reset_context()
+    # Defined first, so that definitions keep the order of the document
+    # when the chunk defines them anew, then again to undo that.
+    _define(md, _state)
+    lines = streaming.preprocess(md, lines, number == 0)
+    _define(md, _state)
+    root = md.parser.parseDocument(lines).getroot()
+    return _process(md, root, place, number == 0)
+
+
+def _process(md, root, place, first, last=False):
+    """
+    Run the treeprocessors over the tree of a chunk and render it. If
+    `place`, the footnotes go at their marker, or at the end if `last`.
+
+    Returns a (html, header ids, whether the footnotes were placed,
+    whether raw html was found, toc headers) tuple, where the toc headers
+    are what `_mark_toc` returns, or None without the toc extension.
+
+    """
+    ids = []
+    if 'headerid' in md.treeprocessors:
+        ids = md.context.header_ids = _ChunkIds()
+    placed = False
+    marks = None
+    for name, treeprocessor in md.treeprocessors.items():
+        if name == 'footnote':
+            footnotes = streaming.get_footnotes(md)
+            if not place or not (last or
+                                 footnotes.findFootnotesPlaceholder(root)):
+                continue
+            placed = True
+        if name == 'toc':
+            marks = _mark_toc(md, root)
+            continue
+        newRoot = md._run_stage('treeprocessor', name, treeprocessor.run,
+                                root)
+        if newRoot:
+            root = newRoot
+        if name == 'headerid':
+            _mark_header_ids(root, ids)
+    html = streaming.render(md, root, first)
+    return html, list(ids), placed, md.raw_html_found, marks
+
+
+def _mark_header_ids(root, ids):
+    """ Replace the ids the headerid extension gave with placeholders. """
+    headers = [elem for elem in root.getiterator() if elem.tag in HEADER_TAGS]
+    for index, (elem, id) in enumerate(zip(headers, ids)):
+        if elem.get('id') == id:
+            elem.set('id', HEADER_ID % index)
+
+
+def _set_header_ids(html, ids):
+    """ Replace the placeholders of header ids in the html of a chunk. """
+    if not ids:
+        return html
+    return HEADER_ID_RE.sub(lambda m: ids[int(m.group(1))], html)
+
+
+def _mark_toc(md, root):
+    """
+    Do what the toc extension does to the tree of a chunk, with
+    placeholders for the toc and for the ids it gives headers.
+
+    Returns the ids in the chunk, and for each header in the order of the
+    toc, a (whether it is at the top level, tag, id, text, html of the
+    text) tuple. The id is None where the toc gives one.
+
+    """
+    toc = md.treeprocessors['toc']
+    ids = [elem.get('id') for elem in root.getiterator() if 'id' in elem.attrib]
+    headers, markers = toc.find(root)
+    for parent, elem in markers:
+        for i in range(len(parent)):
+            if parent[i] == elem:
+                parent[i] = _toc_mark()
+                break
+    anchorlink = toc.config["anchorlink"] in [1, '1', True, 'True', 'true']
+    entries = []
+    for index, (parent, elem, text) in enumerate(headers):
+        id = elem.get('id')
+        if id is None:
+            elem.set('id', TOC_ID % index)
+        if anchorlink:
+            toc.add_anchor(elem, elem.get('id'))
+        # The text as the chunk renders it, with its own raw html
+        link = util.etree.Element('a')
+        link.text = text
+        html = md.serializer(link)
+        html = html[html.index('>') + 1:html.rindex('<')]
+        for pp in md.postprocessors.values():
+            html = pp.run(html)
+        entries.append((parent is root, elem.tag, id, text, html))
+    return ids, entries
+
+
+def _toc_mark():
+    """ Return the element put in a chunk where the toc goes. """
+    mark = util.etree.Element('div')
+    mark.set('class', 'toc')
+    mark.text = TOC
+    return mark
+
+
+def _build_toc(md, marks, header_ids):
+    """
+    Build the toc of the document as the toc extension does, from what
+    `_mark_toc` returns for each chunk and the header ids of each chunk.
+
+    Returns a (html of the toc, ids the toc gives the headers of each
+    chunk) tuple, or None if the toc leaves out headers which the chunks
+    made links to themselves.
+
+    """
+    toc = md.treeprocessors['toc']
+    # The headers at the top level of the document come first, then the
+    # others chunk by chunk.
+    top = []
+    nested = []
+    used_ids = []
+    chunks = []
+    texts = {}
+    for (ids, entries), chunk_ids in zip(marks, header_ids):
+        used_ids.extend([_set_header_ids(id, chunk_ids) for id in ids])
+        headers = []
+        for at_top, tag, id, text, html in entries:
+            header = util.etree.Element(tag)
+            if id is not None:
+                header.set('id', _set_header_ids(id, chunk_ids))
+            (top if at_top else nested).append((header, text))
+            headers.append((header, id is None))
+            texts[header] = html
+        chunks.append(headers)
+
+    div = toc.make_div()
+    links = toc.build(div, top + nested, used_ids)
+    anchorlink = toc.config["anchorlink"] in [1, '1', True, 'True', 'true']
+    if anchorlink and len(links) < len(top) + len(nested):
+        return None
+    html_texts = []
+    for header, link in links:
+        link.text = TOC_LINK % len(html_texts)
+        html_texts.append(texts[header])
+
+    prettify = md.treeprocessors.get('prettify')
+    if prettify:
+        prettify.run(div)
+    div.tail = None
+    html = md.serializer(div)
+    html = TOC_LINK_RE.sub(lambda m: html_texts[int(m.group(1))], html)
+    mark = md.serializer(_toc_mark())
+    toc_ids = [[header.get('id') if given else None
+                for header, given in headers] for headers in chunks]
+    return (mark, html), toc_ids
+
+
+def _set_toc(html, toc, ids):
+    """
+    Put the toc where a chunk has its marker and the ids the toc gives in
+    place of their placeholders.
+
+    """
+    mark, toc_html = toc
+    html = html.replace(mark, toc_html)
+    # The headers the toc gives no id keep none.
+    html = TOC_ID_ATTR_RE.sub(lambda m: ids[int(m.group(2))] and m.group(0)
+                              or u'', html)
+    return TOC_ID_RE.sub(lambda m: ids[int(m.group(1))], html)
@@ -9,9 +9,15 @@ processing.
 """
 
 import re
+from htmlentitydefs import name2codepoint
 import util
 import odict
 
+# A named or numeric character reference
+ENTITY_RE = re.compile(r'&(#[0-9]+|#[xX][0-9a-fA-F]+|[a-zA-Z][a-zA-Z0-9]*);')
+# A tag, comment or other markup in raw html
+TAG_RE = re.compile(r'<[^>]*>')
+
 def build_postprocessors(md_instance, **kwargs):
     """ Build the default postprocessors for Markdown. """
     postprocessors = odict.OrderedDict()
@@ -41,28 +47,67 @@ class Postprocessor(util.Processor):
         """
         pass
 
+    def run_text(self, text):
+        """
+        Take the plain text of the document instead of the html, for
+        `Markdown.convertFormats`, and return it. Subclasses which restore
+        placeholders should implement it. By default the text is left as is,
+        as a postprocessor which works on html does not apply.
+
+        """
+        return text
+
 
 class RawHtmlPostprocessor(Postprocessor):
     """ Restore raw html to the document. """
 
+    RE = re.compile('<p>(%s)</p>|%s' % (util.HTML_PLACEHOLDER_RE.pattern,
+                                         util.HTML_PLACEHOLDER_RE.pattern))
+
     def run(self, text):
-        """ Iterate over html stash and restore "safe" html. """
-        for i in range(self.markdown.htmlStash.html_counter):
-            html, safe  = self.markdown.htmlStash.rawHtmlBlocks[i]
-            if self.markdown.safeMode and not safe:
-                if str(self.markdown.safeMode).lower() == 'escape':
-                    html = self.escape(html)
-                elif str(self.markdown.safeMode).lower() == 'remove':
-                    html = ''
-                else:
-                    html = self.markdown.html_replacement_text
-            if self.isblocklevel(html) and (safe or not self.markdown.safeMode):
-                text = text.replace("<p>%s</p>" % 
-                            (self.markdown.htmlStash.get_placeholder(i)),
-                            html + "\n")
-            text =  text.replace(self.markdown.htmlStash.get_placeholder(i), 
-                                 html)
-        return text
+        """ Replace the placeholders of the html stash in a single pass. """
+        if not self.markdown.htmlStash.html_counter:
+            return text
+        return self.RE.sub(self.restore, text)
+
+    def restore(self, m):
+        """ Return the "safe" html for a placeholder, maybe inside a <p>. """
+        key = m.group(2) or m.group(3)
+        try:
+            html, safe = self.markdown.htmlStash.rawHtmlBlocks[int(key)]
+        except IndexError:
+            return m.group(0)
+        if self.markdown.safeMode and not safe:
+            if str(self.markdown.safeMode).lower() == 'escape':
+                html = self.escape(html)
+            elif str(self.markdown.safeMode).lower() == 'remove':
+                html = ''
+            else:
+                html = self.markdown.html_replacement_text
+        if m.group(1) is None:
+            return html
+        if self.isblocklevel(html) and (safe or not self.markdown.safeMode):
+            return html + "\n"
+        return "<p>%s</p>" % html
+
+    def run_text(self, text):
+        """ Replace the placeholders with the text of the raw html. """
+        if not self.markdown.htmlStash.html_counter:
+            return text
+        return util.HTML_PLACEHOLDER_RE.sub(self.restore_text, text)
+
+    def restore_text(self, m):
+        """ Return the text of the raw html for a placeholder. """
+        try:
+            html, safe = self.markdown.htmlStash.rawHtmlBlocks[int(m.group(1))]
+        except IndexError:
+            return m.group(0)
+        if self.markdown.safeMode and not safe:
+            if str(self.markdown.safeMode).lower() == 'escape':
+                # Shown as is
+                return html
+            return ''
+        return unescape_entities(TAG_RE.sub('', html))
 
     def escape(self, html):
         """ Basic html escaping """
@@ -84,10 +129,16 @@ class RawHtmlPostprocessor(Postprocessor):
 class AndSubstitutePostprocessor(Postprocessor):
     """ Restore valid entities """
 
+    RE = re.compile(re.escape(util.AMP_SUBSTITUTE) + ENTITY_RE.pattern[1:])
+
     def run(self, text):
         text =  text.replace(util.AMP_SUBSTITUTE, "&")
         return text
 
+    def run_text(self, text):
+        """ Replace the entities with the characters. """
+        return self.run(self.RE.sub(unescape_entity, text))
+
 
 class UnescapePostprocessor(Postprocessor):
     """ Restore escaped chars """
@@ -99,3 +150,23 @@ class UnescapePostprocessor(Postprocessor):
 
     def run(self, text):
         return self.RE.sub(self.unescape, text)
+
+    run_text = run
+
+
+def unescape_entity(m):
+    """ Return the character of the reference matched by ENTITY_RE. """
+    name = m.group(1)
+    try:
+        if name[:2] in ('#x', '#X'):
+            return unichr(int(name[2:], 16))
+        if name[0] == '#':
+            return unichr(int(name[1:]))
+        return unichr(name2codepoint[name])
+    except (KeyError, ValueError, OverflowError):
+        return m.group(0)
+
+
+def unescape_entities(text):
+    """ Replace the character references in html text with the characters. """
+    return ENTITY_RE.sub(unescape_entity, text)
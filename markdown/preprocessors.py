@@ -249,6 +249,8 @@ class HtmlBlockPreprocessor(Preprocessor):
                     self.markdown.htmlStash.store('\n\n'.join(items)))
             #new_blocks.append(self.markdown.htmlStash.store('\n\n'.join(items)))
             new_blocks.append('\n')
+        # Streaming conversion does not cut the source inside a raw block.
+        self.markdown.context.unclosed_block = bool(items)
 
         new_text = "\n\n".join(new_blocks)
         return new_text.split("\n")
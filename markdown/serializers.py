@@ -37,6 +37,7 @@
 # --------------------------------------------------------------------
 
 
+import re
 import util
 ElementTree = util.etree.ElementTree
 QName = util.etree.QName
@@ -47,7 +48,8 @@ else:
 PI = util.etree.PI
 ProcessingInstruction = util.etree.ProcessingInstruction
 
-__all__ = ['to_html_string', 'to_xhtml_string']
+__all__ = ['to_html_string', 'to_xhtml_string', 'to_html_min_string',
+           'to_xhtml_min_string', 'to_text_string']
 
 HTML_EMPTY = ("area", "base", "basefont", "br", "col", "frame", "hr",
               "img", "input", "isindex", "link", "meta" "param")
@@ -273,3 +275,265 @@ def to_html_string(element):
 
 def to_xhtml_string(element):
     return _write_html(ElementTree(element).getroot(), format="xhtml")
+
+# --------------------------------------------------------------------
+# minified html
+
+# elements whose content is written as it is
+MIN_VERBATIM = ("pre", "code", "textarea", "script", "style")
+
+# the elements which close an open p element in html5
+P_CLOSERS = ("address", "article", "aside", "blockquote", "details", "div",
+             "dl", "fieldset", "figcaption", "figure", "footer", "form",
+             "h1", "h2", "h3", "h4", "h5", "h6", "header", "hgroup", "hr",
+             "main", "menu", "nav", "ol", "p", "pre", "section", "table",
+             "ul")
+
+# the end tags which html5 allows to omit: tag -> (the tags of the next
+# sibling before which it may be, whether it may be at the end of the
+# parent). a p may only be left open at the end of the parents in
+# P_PARENTS: the root of the tree is stripped and may be followed by
+# anything.
+OPTIONAL_END = {
+    "p": (P_CLOSERS, False),
+    "li": (("li",), True),
+    "dt": (("dt", "dd"), False),
+    "dd": (("dt", "dd"), True),
+    "thead": (("tbody", "tfoot"), False),
+    "tbody": (("tbody", "tfoot"), True),
+    "tfoot": ((), True),
+    "tr": (("tr",), True),
+    "td": (("td", "th"), True),
+    "th": (("td", "th"), True),
+    "option": (("option", "optgroup"), True),
+}
+P_PARENTS = ("li", "dd", "td", "th", "blockquote")
+
+try:
+    MIN_VERBATIM = set(MIN_VERBATIM)
+    P_CLOSERS = set(P_CLOSERS)
+except NameError:
+    pass
+
+# a run of whitespace which renders as one space
+WHITESPACE_RE = re.compile(r"[ \t\n\r\f]{2,}")
+# an attribute value which needs no quotes in html5. placeholders are
+# quoted, as postprocessors may put any character in their place.
+UNQUOTED_RE = re.compile(u"^[^ \t\n\r\f\"'=<>`%s%s]+$" % (util.STX, util.ETX))
+
+def _escape_attrib_min(text, format):
+    # quote attribute value as shortly as the format allows
+    if format != "html":
+        return "\"%s\"" % _escape_attrib_html(text)
+    try:
+        if "&" in text:
+            text = text.replace("&", "&amp;")
+        if "<" in text:
+            text = text.replace("<", "&lt;")
+        if ">" in text:
+            text = text.replace(">", "&gt;")
+    except (TypeError, AttributeError):
+        _raise_serialization_error(text)
+    if UNQUOTED_RE.match(text):
+        return text
+    if "\"" not in text:
+        return "\"%s\"" % text
+    if "'" not in text:
+        return "'%s'" % text
+    return "\"%s\"" % text.replace("\"", "&quot;")
+
+def _is_stashed(elem):
+    # a paragraph which RawHtmlPostprocessor replaces, tags and all
+    text = elem.text
+    if elem.tag != "p" or len(elem) or not text:
+        return False
+    m = util.HTML_PLACEHOLDER_RE.match(text)
+    return m is not None and m.end() == len(text)
+
+def _min_text(text, block, verbatim):
+    # the text of an element, or the tail of a child, in minified form.
+    # whitespace alone is dropped next to blocks.
+    if verbatim:
+        return _escape_cdata(text)
+    if block and text.isspace():
+        return ""
+    return _escape_cdata(WHITESPACE_RE.sub(" ", text))
+
+def _has_raw_html(text):
+    # whether text holds raw html, which may leave any element open
+    return util.STX in text and \
+        util.HTML_PLACEHOLDER_RE.search(text) is not None
+
+def _omit_end(elem, next, parent, tail):
+    # whether the end tag of elem, followed by tail and the element next,
+    # may be left out of html, if no raw html is in elem
+    if tail:
+        return False
+    rule = OPTIONAL_END.get(elem.tag)
+    if rule is None:
+        return False
+    siblings, last = rule
+    if next is None:
+        if elem.tag == "p":
+            return parent in P_PARENTS
+        return last
+    if elem.tag == "p" and _is_stashed(next):
+        return False
+    return next.tag in siblings
+
+def _serialize_min(write, elem, qnames, namespaces, format, verbatim,
+                   omit=False):
+    # serialize elem as _serialize_html does, less its tail, which the
+    # parent writes, and less what html does not need. returns whether
+    # raw html is in elem.
+    tag = elem.tag
+    text = elem.text
+    raw = False
+    if tag is Comment:
+        write("<!--%s-->" % _escape_cdata(text))
+    elif tag is ProcessingInstruction:
+        write("<?%s?>" % _escape_cdata(text))
+    else:
+        tag = qnames[tag]
+        if tag is not None:
+            write("<" + tag)
+            items = elem.items()
+            if items or namespaces:
+                items.sort() # lexical order
+                for k, v in items:
+                    if isinstance(k, QName):
+                        k = k.text
+                    if isinstance(v, QName):
+                        v = "\"%s\"" % qnames[v.text]
+                    elif qnames[k] == v and format == 'html':
+                        # handle boolean attributes
+                        write(" %s" % v)
+                        continue
+                    else:
+                        v = _escape_attrib_min(v, format)
+                    write(" %s=%s" % (qnames[k], v))
+                if namespaces:
+                    items = namespaces.items()
+                    items.sort(key=lambda x: x[1]) # sort on prefix
+                    for v, k in items:
+                        if k:
+                            k = ":" + k
+                        write(" xmlns%s=\"%s\"" % (k, _escape_attrib(v)))
+            if format == "xhtml" and tag in HTML_EMPTY:
+                write(" />")
+                return False
+            write(">")
+            tag = tag.lower()
+            if tag == "script" or tag == "style":
+                if text:
+                    write(text)
+                text = None
+            verbatim = verbatim or tag in MIN_VERBATIM
+        block = util.isBlockLevel(tag)
+        children = list(elem)
+        if text:
+            raw = _has_raw_html(text)
+            write(_min_text(text, block and (not children or
+                            util.isBlockLevel(children[0].tag)), verbatim))
+        for i, e in enumerate(children):
+            next = i + 1 < len(children) and children[i + 1] or None
+            tail = e.tail
+            if tail:
+                tail = _min_text(tail, block and util.isBlockLevel(e.tag) and
+                                 (next is None or
+                                  util.isBlockLevel(next.tag)), verbatim)
+            if _serialize_min(write, e, qnames, None, format, verbatim,
+                              format == "html" and
+                              _omit_end(e, next, tag, tail)):
+                raw = True
+            if tail:
+                raw = raw or _has_raw_html(tail)
+                write(tail)
+        if tag is not None and tag not in HTML_EMPTY and (raw or not omit):
+            write("</" + tag + ">")
+    return raw
+
+class _PlainNames(dict):
+    # the qnames of a tree without namespaces, found as they are needed,
+    # so that the tree is walked once. raises ValueError otherwise.
+    def __missing__(self, name):
+        if not isinstance(name, basestring) or name[:1] == "{":
+            raise ValueError("cannot write %r without namespaces" % name)
+        return name
+
+def _write_html_min(root, format):
+    assert root is not None
+    data = []
+    write = data.append
+    try:
+        _serialize_min(write, root, _PlainNames({None: None}), None, format,
+                       False)
+    except ValueError:
+        del data[:]
+        qnames, namespaces = _namespaces(root)
+        _serialize_min(write, root, qnames, namespaces, format, False)
+    if root.tail:
+        write(_min_text(root.tail, False, False))
+    return "".join(data)
+
+def to_html_min_string(element):
+    """
+    Return `element` serialized as html with what html5 can do without
+    left out: whitespace between blocks, the end tags which may be
+    omitted, and the quotes of attribute values which need none.
+
+    """
+    return _write_html_min(ElementTree(element).getroot(), "html")
+
+def to_xhtml_min_string(element):
+    """ Return `element` serialized as xhtml without whitespace between blocks. """
+    return _write_html_min(ElementTree(element).getroot(), "xhtml")
+
+# the minified serializers of the output formats
+MINIFIED = {
+    to_html_string: to_html_min_string,
+    to_xhtml_string: to_xhtml_min_string,
+}
+
+# --------------------------------------------------------------------
+# plain text
+
+def _text(write, text):
+    # the newlines PrettifyTreeprocessor adds between blocks are written
+    # as None, so that each run of them can be written as one newline.
+    if text.isspace() and "\n" in text:
+        write(None)
+    else:
+        write(text)
+
+def _write_text(write, elem, excluded):
+    tag = elem.tag
+    if tag is not Comment and tag is not ProcessingInstruction and \
+            id(elem) not in excluded:
+        if elem.text:
+            _text(write, elem.text)
+        for e in elem:
+            _write_text(write, e, excluded)
+    if elem.tail:
+        _text(write, elem.tail)
+
+def to_text_string(root, excluded=()):
+    """
+    Return the text of the content of `root`, without markup, with a
+    newline between blocks. The text of the elements in `excluded` is left
+    out.
+
+    """
+    excluded = set([id(elem) for elem in excluded])
+    data = []
+    if root.text:
+        _text(data.append, root.text)
+    for e in root:
+        _write_text(data.append, e, excluded)
+    text = []
+    for i, piece in enumerate(data):
+        if piece is not None:
+            text.append(piece)
+        elif i and data[i - 1] is not None:
+            text.append("\n")
+    return "".join(text).strip()
@@ -0,0 +1,378 @@
+"""
+STREAMING CONVERSION
+=============================================================================
+
+Convert a large Markdown file without holding all of it, its tree or its
+html in memory at once. The file is memory-mapped and read twice:
+
+1. The first pass runs the preprocessors over the source a chunk at a time
+   to collect what any part of the document may refer to: reference
+   definitions, footnote definitions and abbreviations. Their lines are
+   dropped. The pass also decides where the chunks end.
+2. The second pass parses, processes and serializes each chunk in turn and
+   writes its html to the output before reading the next one.
+
+Chunks are only cut where the blocks on either side of the cut are parsed
+alike whole or apart: before an unindented line which follows a blank line
+and does not start a list item, a blockquote or a definition, and not
+inside a fenced code block, a raw html block or a definition list. The
+output is then the same as that of `Markdown.convertFile`. The ids made from
+headers which contain raw html can differ, as the placeholders of the html
+are numbered by chunk.
+
+    md = markdown.Markdown(extensions=['footnotes'])
+    md.convertFile('big.md', 'big.html', stream=True)
+
+Only the processors in `STREAMABLE` are known to work on chunks. A
+Markdown instance with others, such as those of the toc or rss extensions,
+converts the file whole, as it does for input which cannot be mapped, such
+as a pipe.
+
+"""
+
+import re
+import sys
+import mmap
+import codecs
+import logging
+import util
+
+logger = logging.getLogger('MARKDOWN')
+
+# Size, in characters, from which a chunk is ended at the next safe cut.
+CHUNK_SIZE = 64 * 1024
+
+# The processors, by stage and name, which can be run on chunks.
+STREAMABLE = {
+    'preprocessor': ['fenced_code_block', 'meta', 'html_block', 'footnote',
+                     'abbr', 'reference'],
+    'blockprocessor': ['empty', 'indent', 'code', 'hashheader',
+                       'setextheader', 'hr', 'olist', 'ulist', 'quote',
+                       'paragraph', 'defindent', 'deflist', 'table'],
+    'treeprocessor': ['footnote', 'hilite', 'inline', 'attr_list', 'headerid',
+                      'prettify'],
+    'postprocessor': ['raw_html', 'amp_substitute', 'footnote', 'unescape'],
+}
+
+FENCE_RE = re.compile(r'^(~{3,}|`{3,})[ ]*(\{?\.?[a-zA-Z0-9_+-]*\}?)?[ ]*$')
+DEFINITION_RE = re.compile(r'^[ ]{0,3}:[ ]{1,3}')
+# Lines which may carry on the block before them, and the definitions of
+# references and footnotes, which leave the blocks around them adjacent
+CONTINUATION_RE = re.compile(r'^([ \t>:*+-]|\d|\[[^\]]*\]:)')
+# The characters `\s` matches in `Markdown.convert`
+WHITESPACE = u' \t\n\r\f\v'
+
+
+def convert_file(md, input=None, output=None, encoding=None,
+                 chunk_size=CHUNK_SIZE):
+    """
+    Convert a Markdown file chunk by chunk with the Markdown instance `md`.
+
+    The arguments are those of `Markdown.convertFile`, which is called
+    instead when the file or `md` cannot be streamed. Returns `md`.
+
+    """
+    encoding = encoding or "utf-8"
+    reason = unstreamable(md, encoding)
+    source = None
+    if reason is None:
+        try:
+            source = _map(input or sys.stdin)
+        except (AttributeError, EnvironmentError, ValueError), e:
+            reason = 'cannot map input: %s' % e
+    if source is None:
+        logger.warning('Converting without streaming: %s' % reason)
+        return md.convertFile(input, output, encoding)
+
+    try:
+        write, close = writer(output, encoding)
+        try:
+            _convert(md, source, write, encoding, chunk_size)
+        finally:
+            close()
+    finally:
+        source.close()
+    return md
+
+
+def unstreamable(md, encoding="utf-8", known=None):
+    """
+    Return why `md` cannot stream a file in `encoding`, or None. `known`
+    maps stages to the names of other processors which the caller knows
+    to work on chunks.
+
+    """
+    try:
+        if u'\n'.encode(encoding) != '\n':
+            return 'encoding "%s" is not ASCII compatible' % encoding
+    except LookupError:
+        return 'unknown encoding "%s"' % encoding
+    if not md.stripTopLevelTags:
+        return 'top-level tags are kept'
+    stages = [('preprocessor', md.preprocessors),
+              ('blockprocessor', md.parser.blockprocessors),
+              ('treeprocessor', md.treeprocessors),
+              ('postprocessor', md.postprocessors)]
+    for stage, processors in stages:
+        for name in processors.keys():
+            if name not in STREAMABLE[stage] and \
+                    name not in (known or {}).get(stage, ()):
+                return 'the %s "%s" needs the whole document' % (stage, name)
+    return None
+
+
+def _map(input):
+    """ Return a memory map of an input file path or file object. """
+    if isinstance(input, basestring):
+        input_file = open(input, 'rb')
+        try:
+            return mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            input_file.close()
+    source = mmap.mmap(input.fileno(), 0, access=mmap.ACCESS_READ)
+    source.seek(input.tell())
+    return source
+
+
+def writer(output, encoding):
+    """ Return a write function for the output and one to close it. """
+    if output is None:
+        if sys.stdout.encoding:
+            return sys.stdout.write, lambda: None
+        output = sys.stdout
+    if isinstance(output, basestring):
+        output_file = codecs.open(output, "w", encoding=encoding,
+                                  errors="xmlcharrefreplace")
+        return output_file.write, output_file.close
+    # Don't close here. User may want to write more.
+    writer = codecs.getwriter(encoding)(output, errors="xmlcharrefreplace")
+    return writer.write, lambda: None
+
+
+def _lines(source, start, encoding, tab_length):
+    """ Yield the lines of a mapped file from `start` (see `split_lines`). """
+    source.seek(start)
+    texts = (data.decode(encoding) for data in iter(source.readline, ''))
+    return split_lines(texts, tab_length)
+
+
+def split_lines(texts, tab_length):
+    """
+    Yield the lines of a document given as a sequence of texts, each ending
+    with a line break but the last, as `Markdown.convert` splits them:
+    whitespace between lines is reduced to one blank line and two blank
+    lines end the document.
+
+    """
+    first = True
+    blank = False
+    for text in texts:
+        if first:
+            text = text.lstrip(u'\ufeff')
+        text = text.replace(util.STX, "").replace(util.ETX, "")
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+        if text.endswith("\n"):
+            text = text[:-1]
+        for line in text.split("\n"):
+            if first:
+                first = False
+            elif not line.strip(WHITESPACE):
+                blank = True
+                continue
+            elif blank:
+                blank = False
+                yield ""
+            yield line.expandtabs(tab_length)
+    yield ""
+    yield ""
+
+
+class Chunker:
+    """ Find the lines before which a chunk may end. """
+
+    def __init__(self):
+        self.blank = False
+        self.fence = None
+        self.deflist = False
+
+    def can_cut(self, line):
+        """ Return whether a chunk may end before `line`, then take it. """
+        cut = False
+        if not line:
+            self.blank = True
+            return False
+        if self.fence is not None:
+            if line.rstrip(' ') == self.fence:
+                self.fence = None
+        else:
+            if self.blank and not CONTINUATION_RE.match(line):
+                cut = not self.deflist
+                self.deflist = False
+            m = FENCE_RE.match(line)
+            if m:
+                self.fence = m.group(1)
+        if DEFINITION_RE.match(line):
+            self.deflist = True
+        self.blank = False
+        return cut
+
+
+def preprocess(md, lines, first):
+    """ Run the preprocessors on the lines of a chunk. """
+    for name, prep in md.preprocessors.items():
+        if name == 'meta' and not first:
+            continue
+        lines = md._run_stage('preprocessor', name, prep.run, lines)
+    return lines
+
+
+def _is_open(md):
+    """ Whether the last chunk preprocessed ended inside a raw html block. """
+    return getattr(md.context, 'unclosed_block', False)
+
+
+def get_footnotes(md):
+    """ Return the footnotes extension of `md`, or None. """
+    if 'footnote' in md.preprocessors:
+        return md.preprocessors['footnote'].footnotes
+    return None
+
+
+def collect(md, lines, chunk_size=CHUNK_SIZE):
+    """
+    Preprocess the lines of the whole source to collect the definitions of
+    the document.
+
+    Returns the number of lines of each chunk, or None if the source is
+    blank.
+
+    """
+    sizes = []
+    chunk = []
+    size = 0
+    text = False
+    chunker = Chunker()
+    for line in lines:
+        if chunker.can_cut(line) and size >= chunk_size:
+            preprocess(md, chunk + [""], not sizes)
+            md.htmlStash.reset()
+            if not _is_open(md):
+                sizes.append(len(chunk))
+                chunk = []
+                size = 0
+        chunk.append(line)
+        size += len(line) + 1
+        text = text or bool(line.strip())
+    if not text:
+        return None
+    sizes.append(len(chunk))
+    preprocess(md, chunk, len(sizes) == 1)
+    md.htmlStash.reset()
+    return sizes
+
+
+def chunks(lines, sizes):
+    """ Yield the lines of each chunk, of `sizes` lines each. """
+    for number, count in enumerate(sizes):
+        chunk = [lines.next() for i in range(count)]
+        if number < len(sizes) - 1:
+            # End each chunk as the document ends.
+            chunk.append("")
+        yield chunk
+
+
+def render(md, root, first):
+    """ Serialize a chunk tree and run the postprocessors on the html. """
+    if not first:
+        # The line break before the first block belongs to the previous
+        # chunk.
+        root.text = None
+    html = md._run_stage('serializer', md.output_format, md.serializer, root)
+    try:
+        start = html.index('<%s>' % md.doc_tag) + len(md.doc_tag) + 2
+        html = html[start:html.rindex('</%s>' % md.doc_tag)]
+    except ValueError:
+        if html.strip().endswith('<%s />' % md.doc_tag):
+            html = u''
+        else:
+            raise ValueError('Markdown failed to strip top-level tags. '
+                             'Document=%r' % html.strip())
+    md.raw_html_found = md.raw_html_found or md.htmlStash.raw_html_found
+    for name, pp in md.postprocessors.items():
+        html = md._run_stage('postprocessor', name, pp.run, html)
+    md.htmlStash.reset()
+    return html
+
+
+class Output:
+    """ Write the html of the chunks stripped as `convert` strips it whole. """
+
+    def __init__(self, write):
+        self.write = write
+        self.started = False
+        self.space = u''
+
+    def add(self, html):
+        if not self.started:
+            html = html.lstrip()
+            if not html:
+                return
+            self.started = True
+        body = html.rstrip()
+        if body:
+            self.write(self.space + body)
+            self.space = html[len(body):]
+        else:
+            self.space += html
+
+
+def _convert(md, source, write, encoding, chunk_size):
+    """ Convert the mapped source and write the html chunk by chunk. """
+    md._reset_context()
+    start = source.tell()
+    sizes = collect(md, _lines(source, start, encoding, md.tab_length),
+                    chunk_size)
+    if sizes is None:
+        return
+
+    # What the whole document defines, to undo a chunk defining it anew
+    references = md.references.copy()
+    patterns = (md.context.inlinePatterns or {}).items()
+    footnotes = get_footnotes(md)
+    if footnotes is not None:
+        notes = footnotes.footnotes.items()
+    placed = False
+    output = Output(write)
+
+    source_lines = _lines(source, start, encoding, md.tab_length)
+    for number, lines in enumerate(chunks(source_lines, sizes)):
+        lines = preprocess(md, lines, number == 0)
+        md.references.update(references)
+        for key, pattern in patterns:
+            md.context.inlinePatterns[key] = pattern
+        if footnotes is not None:
+            for id, text in notes:
+                footnotes.setFootnote(id, text)
+
+        root = md.parser.parseDocument(lines).getroot()
+        for name, treeprocessor in md.treeprocessors.items():
+            if name == 'footnote':
+                # The footnotes go where the first chunk with the marker
+                # puts them, or after the last chunk.
+                if placed or not footnotes.findFootnotesPlaceholder(root):
+                    continue
+                placed = True
+            newRoot = md._run_stage('treeprocessor', name, treeprocessor.run,
+                                    root)
+            if newRoot:
+                root = newRoot
+        output.add(render(md, root, number == 0))
+
+    if footnotes is not None and not placed:
+        root = util.etree.Element(md.doc_tag)
+        for name, treeprocessor in md.treeprocessors.items():
+            newRoot = md._run_stage('treeprocessor', name, treeprocessor.run,
+                                    root)
+            if newRoot:
+                root = newRoot
+        output.add(render(md, root, not output.started))
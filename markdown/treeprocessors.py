@@ -59,6 +59,12 @@ class InlineProcessor(Treeprocessor):
         self.__placeholder_re = util.INLINE_PLACEHOLDER_RE
         self.markdown = md
 
+    def _get_stashed_nodes(self):
+        return self.markdown.context.stashed_nodes
+
+    # The nodes of the current conversion, kept in its RenderContext
+    stashed_nodes = property(_get_stashed_nodes)
+
     def __makePlaceholder(self, type):
         """ Generate a placeholder """
         id = "%04d" % len(self.stashed_nodes)
@@ -103,11 +109,35 @@ class InlineProcessor(Treeprocessor):
 
         """
         if not isinstance(data, util.AtomicString):
+            stats = self.markdown.stats
+            patterns = self.markdown.context.inlinePatterns or \
+                self.markdown.inlinePatterns
             startIndex = 0
-            while patternIndex < len(self.markdown.inlinePatterns):
-                data, matched, startIndex = self.__applyPattern(
-                    self.markdown.inlinePatterns.value_for_index(patternIndex),
-                    data, patternIndex, startIndex)
+            while patternIndex < len(patterns):
+                pattern = patterns.value_for_index(patternIndex)
+                triggers = getattr(pattern, 'triggers', None)
+                if triggers:
+                    for char in triggers:
+                        if char in data:
+                            break
+                    else:
+                        # The pattern cannot match this text.
+                        if stats is not None:
+                            stats.count('inlinepattern',
+                                        patterns.keyOrder[patternIndex],
+                                        'skipped')
+                        patternIndex += 1
+                        continue
+                if stats is None:
+                    data, matched, startIndex = self.__applyPattern(
+                        pattern, data, patternIndex, startIndex)
+                else:
+                    name = patterns.keyOrder[patternIndex]
+                    data, matched, startIndex = stats.time('inlinepattern',
+                        name, self.__applyPattern,
+                        pattern, data, patternIndex, startIndex)
+                    if matched:
+                        stats.count('inlinepattern', name, 'hits')
                 if not matched:
                     patternIndex += 1
         return data
@@ -274,7 +304,7 @@ class InlineProcessor(Treeprocessor):
         Returns: ElementTree object with applied inline patterns.
 
         """
-        self.stashed_nodes = {}
+        self.markdown.context.stashed_nodes = {}
 
         stack = [tree]
 
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import re
 from logging import CRITICAL
+from timeit import default_timer
 
 import etree_loader
 
@@ -28,6 +29,8 @@ INLINE_PLACEHOLDER_PREFIX = STX+"klzzwxh:"
 INLINE_PLACEHOLDER = INLINE_PLACEHOLDER_PREFIX + "%s" + ETX
 INLINE_PLACEHOLDER_RE = re.compile(INLINE_PLACEHOLDER % r'([0-9]{4})')
 AMP_SUBSTITUTE = STX+"amp"+ETX
+HTML_PLACEHOLDER = STX+"wzxhzdk:%s"+ETX
+HTML_PLACEHOLDER_RE = re.compile(HTML_PLACEHOLDER % r'([0-9]+)')
 
 """
 Constants you probably do not need to change
@@ -85,6 +88,8 @@ class HtmlStash:
         """ Create a HtmlStash. """
         self.html_counter = 0 # for counting inline html segments
         self.rawHtmlBlocks=[]
+        # Set once html which is not labeled safe is stored
+        self.raw_html_found = False
 
     def store(self, html, safe=False):
         """
@@ -100,15 +105,147 @@ class HtmlStash:
         Returns : a placeholder string
 
         """
+        if not safe:
+            self.raw_html_found = True
         self.rawHtmlBlocks.append((html, safe))
         placeholder = self.get_placeholder(self.html_counter)
         self.html_counter += 1
         return placeholder
 
+    def fill(self, key, html, safe=False):
+        """
+        Replace the HTML segment stored under the placeholder number `key`,
+        for segments stored before their HTML is known.
+
+        """
+        if not safe:
+            self.raw_html_found = True
+        self.rawHtmlBlocks[key] = (html, safe)
+
     def reset(self):
         self.html_counter = 0
         self.rawHtmlBlocks = []
+        self.raw_html_found = False
 
     def get_placeholder(self, key):
-        return "%swzxhzdk:%d%s" % (STX, key, ETX)
+        return HTML_PLACEHOLDER % key
+
+
+class RenderContext:
+    """
+    The state of one conversion.
+
+    A Markdown instance, its processors and its patterns hold the settings of
+    the conversion only, so threads can share one. What a conversion finds in
+    its document is kept on a RenderContext instead. Each conversion starts a
+    new one, which ``Markdown.context`` returns in the thread running it.
+    Extensions keep the state of a document here as well.
+
+    """
 
+    def __init__(self):
+        self.lines = []
+        self.references = {}
+        self.htmlStash = HtmlStash()
+        self.raw_html_found = False
+        # A copy of the inline patterns of the Markdown instance, made when
+        # the document adds patterns of its own, such as abbreviations
+        self.inlinePatterns = None
+        # The State of the BlockParser and the nodes stashed by the
+        # InlineProcessor
+        self.parser_state = None
+        self.stashed_nodes = {}
+        # Text appended to elements by the BlockParser, joined when the
+        # outermost parseBlocks call returns (see ``BlockParser.addText``)
+        self.parse_depth = 0
+        self.text_pieces = {}
+        # Whether the BlockParser cut an excerpt short of the end of the
+        # document (see ``BlockParser.parseDocument``)
+        self.excerpt_cut = False
+        # Elements which the plain text of ``Markdown.convertFormats`` leaves
+        # out, such as the table of contents
+        self.text_excluded = []
+        # The output format being written by ``Markdown.convertFormats``,
+        # or None for that of the Markdown instance
+        self.output_format = None
+
+
+class Stats:
+    """
+    Record the wall time and number of calls of each stage of a conversion.
+
+    Markdown keeps an instance in ``Markdown.stats`` when created with
+    ``collect_stats=True``. Records are keyed by stage and name, where the
+    stage is one of ``STAGES`` and the name is the key of the processor or
+    pattern in its OrderedDict (the output format for the serializer).
+
+    Times are exclusive. Time spent in a nested stage, such as an inline
+    pattern run by the inline treeprocessor or a block processor called
+    recursively by another, is only counted for the nested stage. The times
+    of all records therefore add up to the time of the conversion.
+
+    Events other than calls are counted with ``count``, such as the number
+    of texts an inline pattern was skipped for or matched in.
+
+    """
+
+    STAGES = ['preprocessor', 'blocktest', 'blockprocessor', 'treeprocessor',
+              'inlinepattern', 'serializer', 'postprocessor']
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """ Forget all records. """
+        self.records = {}
+        self.counts = {}
+        self._nested = []
+
+    def time(self, stage, name, func, *args):
+        """ Call ``func(*args)``, record its time and return its result. """
+        self._nested.append(0.0)
+        start = default_timer()
+        try:
+            return func(*args)
+        finally:
+            elapsed = default_timer() - start
+            nested = self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+            record = self.records.get((stage, name))
+            if record is None:
+                record = self.records[(stage, name)] = [0, 0.0]
+            record[0] += 1
+            record[1] += elapsed - nested
+
+    def count(self, stage, name, event):
+        """ Count one `event` for a stage and name. """
+        key = (stage, name, event)
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def get(self, stage, name):
+        """ Return (calls, seconds) recorded for a stage and name. """
+        return tuple(self.records.get((stage, name), (0, 0.0)))
+
+    def total(self, stage=None):
+        """ Return the seconds spent in `stage`, or in all stages. """
+        return sum([seconds for (st, name), (calls, seconds)
+                    in self.records.items() if stage in (None, st)])
+
+    def report(self):
+        """ Return the records as a table, slowest first within each stage. """
+        lines = ['%-15s %-20s %8s %10s' % ('stage', 'name', 'calls', 'ms')]
+        for stage in self.STAGES:
+            items = [(seconds, name, calls) for (st, name), (calls, seconds)
+                     in self.records.items() if st == stage]
+            items.sort(reverse=True)
+            for seconds, name, calls in items:
+                lines.append('%-15s %-20s %8d %10.3f' %
+                             (stage, name, calls, seconds * 1000))
+        lines.append('%-15s %-20s %8s %10.3f' %
+                     ('total', '', '', self.total() * 1000))
+        counts = self.counts.items()
+        counts.sort()
+        for (stage, name, event), number in counts:
+            lines.append('%-15s %-20s %8d %s' % (stage, name, number, event))
+        return '\n'.join(lines)
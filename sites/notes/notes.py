@@ -4,10 +4,22 @@ import logging
 import markdown
 import datetime
 import re
+import json
+import hashlib
 import StringIO
 
 from google.appengine.ext import ndb
 
+# One converter serves all requests. Markdown keeps the state of each
+# conversion apart per thread, so concurrent requests can share it.
+MARKDOWN = markdown.Markdown( extensions = ['extra', 'toc',
+                                            'sane_lists', 'meta',
+                                            'nl2br'],
+                              safe_mode='replace',
+                              output_format = 'html5',
+                              html_replacement_text=
+                                  '<em class="alert">No raw HTML please.</em>')
+
 class UnauthorisedException(Exception):
     pass
 
@@ -75,6 +87,9 @@ class NotesManager(object):
         elif self.CMD == 'copy':
             logging.info('----------------> copy')
             self.create_copy()
+        elif self.CMD == 'preview':
+            logging.info('----------------> preview')
+            self.render_preview()
         else:
             logging.info('----------------------> CMD %s' % self.CMD)
             logging.info('----------------> INPUT_KEY %s' % self.INPUT_KEY)
@@ -125,7 +140,10 @@ class NotesManager(object):
             # TODO: check that upload is a valid text file
             if VALID_UPLOAD:
                 display_fields = {}
-                title = StringIO.StringIO(upload).readline()
+                # The title of the note, from its meta header or its first
+                # header, or else its first line
+                title = markdown.extract_metadata(upload)['title'] or \
+                        StringIO.StringIO(upload).readline()
                 title = title.strip()
                 title = re.sub(r'^[^a-zA-Z0-9]*', '', title)
                 title = re.sub(r'[^a-zA-Z0-9_ ]', '_', title)
@@ -370,6 +388,36 @@ class NotesManager(object):
             self.HANDLER.redirect('/notes/new')
 
 
+    def render_preview(self):
+        '''Return the changed blocks of a live preview as JSON patches.
+
+        This is called by a POST request from the edit form, with the
+        current source text and the hashes of the blocks the preview
+        already shows, comma separated. The source is converted block by
+        block, and only the blocks whose hash differs from the one shown
+        at their index are sent back, with their index, hash and HTML.
+        The count tells the form how many blocks the preview keeps.
+
+        '''
+        source = self._to_unicode_or_bust(self.HANDLER.request.get('source'))
+        shown = self.HANDLER.request.get('hashes').split(',')
+        blocks = MARKDOWN.convertBlocks(source)
+        patches = []
+        for index, html in enumerate(blocks):
+            html = self._extra_formatting(html)
+            html = self._view_helper_purge_extra_markup(html + '\n').strip()
+            digest = hashlib.sha1(html.encode('utf-8')).hexdigest()[:16]
+            if index >= len(shown) or shown[index] != digest:
+                patches.append(dict(index=index, hash=digest, html=html))
+        if MARKDOWN.raw_html_found:
+            warning = 'No HTML tags are allowed in the text.'
+        else:
+            warning = ''
+        self.HANDLER.response.headers['Content-Type'] = 'application/json'
+        self.HANDLER.write(json.dumps(dict(count=len(blocks),
+                                           patches=patches,
+                                           warning=warning)))
+
     def render_edit(self):
         '''Edit the current note, if access is authorised, else offer blank.
 
@@ -452,15 +500,9 @@ class NotesManager(object):
 
         '''
         source = self._to_unicode_or_bust(source)
-        replacer = '<em class="alert">No raw HTML please.</em>'
-        md = markdown.Markdown( extensions = ['extra', 'toc', 
-                                              'sane_lists', 'meta', 
-                                              'nl2br'],
-                                safe_mode='replace',
-                                output_format = 'html5',
-                                html_replacement_text=replacer)
+        md = MARKDOWN
         target = md.convert(source)
-        if replacer in target:
+        if md.raw_html_found:
             html_in_source = 'No HTML tags are allowed in the text.'
         else:
             html_in_source = ''